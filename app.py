@@ -1,17 +1,38 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+# 启动入口：最先开始计时，并只在这里加载一次 .env (其他模块导入时直接读取环境变量)
+import startup
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from quart import Quart, render_template, request, Response, url_for, send_file
+from socketio import AsyncServer, ASGIApp
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+import asyncio
 import os
 from uuid import uuid4
 # 确保导入了所有需要的工具函数和 Path
-from tools import get_player, get_music, music_dir, get_path, verify_name, download_status, check_music_open, \
-    edit_play_queue, Path
-from downloader import download_task, extract_url
-from typing import Dict, Union, List, Any
-from dotenv import load_dotenv
+from tools import get_player, get_music, music_dir, get_path, verify_name, check_music_open, edit_play_queue, \
+    get_library, find_music, run_blocking, Path
+from downloader import add_task, extract_url
+import downloader
+import dc_extra
+import player_state
+from typing import Dict, Union, List, Any, Optional
 import shutil
-import re
-import dc  # 导入 dc 以调用 dc.start()
-import threading  # 确保 threading 导入
+import signal
+import dc  # 导入 dc 以调用 dc.run_bot()，退出时关闭 dc.bot
+from events import subscribe
+from broadcast import Broadcaster
+from serializer import socketio_json, encode_for, MSGPACK_MIMETYPE
+import metrics
+from diagnostics import snapshot, diagnose, monitor_loop_lag
+from profiling import profile_routes, install_audit_hook
+from static_assets import StaticAssets, compress_variants, select_variant, etag_matches, IMMUTABLE_CACHE, \
+    REVALIDATE_CACHE
+import hashlib
+import mimetypes
+import threading
 
 # --- 修复：确保 Bot 命令和事件在 Bot 启动前加载 ---
 # 必须先导入命令和事件文件，才能让 Discord Bot 注册这些命令
@@ -20,62 +41,204 @@ import dc_event
 
 # ----------------------------------------------------
 
-
-load_dotenv()
-
-app = Flask(__name__)
+# Web 服务与 Discord Bot 运行在同一个 asyncio 事件循环中 (Quart + python-socketio ASGI + Hypercorn)
+# 关闭 Quart 自带的静态路由，改用下方预压缩 + 内容哈希的实现
+app = Quart(__name__, static_folder=None)
 # 优化：为 SECRET_KEY 提供更鲁棒的默认值
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", uuid4().hex)
-socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*")
+socketio = AsyncServer(async_mode="asgi", cors_allowed_origins="*", json=socketio_json())
+asgi_app = ASGIApp(socketio, app)
+
+assets = StaticAssets(Path(app.root_path) / "static")
 
 connected_sids = set()
+# 按主题划分房间，客户端连接时默认加入全部房间，可通过 subscribe 事件调整
+LIBRARY_ROOM = "library"
+PLAYER_ROOM = "player"
+DOWNLOAD_ROOM = "downloads"
+ROOMS = (LIBRARY_ROOM, PLAYER_ROOM, DOWNLOAD_ROOM)
+# 音乐库更新的合并窗口 (秒)：窗口内的多次删除/扫描只推送一次
+LIBRARY_COALESCE_DELAY = 0.5
+
+# 所有广播都经过同一个调度器 (线程安全，可在下载线程中调用)
+broadcaster = Broadcaster(socketio)
+_player_push = {"last": None}
+_library_push = {"full": False, "items": {}}
+_library_push_lock = threading.Lock()
+
+
+@subscribe("download_progress")
+def push_download_progress(status: Dict[str, Union[str, float]]):
+    """下载进度变化时推送给 Web 客户端 (取代轮询 /download_status)，同一任务只推送最新进度"""
+    payload = {"updated_type": "download_status_updated", **status}
+    broadcaster.schedule(f"download:{status.get('id')}", DOWNLOAD_ROOM, lambda: payload)
+
+
+@subscribe("player_changed")
+def push_player_status(_=None):
+    """播放器状态变化时推送 (同一轮事件循环内的多次变化合并为一次)"""
+    broadcaster.schedule("player", PLAYER_ROOM, _build_player_payload)
+
+
+def _build_player_payload() -> Optional[Dict]:
+    """计算一次播放器状态，未变化时不推送"""
+    data = get_player_data()
+    if data == _player_push["last"]:
+        return None
+    _player_push["last"] = data
+    return data
+
+
+@subscribe("library_changed")
+def push_library_change(change: Dict[str, Any]):
+    """索引变化时推送：合并窗口内有全量扫描则推送整个列表，否则只推送受影响的条目"""
+    with _library_push_lock:
+        if change["action"] == "rescan":
+            _library_push["full"] = True
+        else:
+            item = change["item"]
+            # 单曲和播放列表可能同名，按 (类型, 名称) 合并
+            _library_push["items"][(item["type"], item["name"])] = item
+    broadcaster.schedule("library", LIBRARY_ROOM, _build_library_payload, delay=LIBRARY_COALESCE_DELAY)
+
+
+def _build_library_payload() -> Optional[Dict]:
+    """取出合并窗口内累积的音乐库变化并构建一次 payload"""
+    with _library_push_lock:
+        full, items = _library_push["full"], _library_push["items"]
+        _library_push["full"], _library_push["items"] = False, {}
+    if full:
+        return get_music_data()
+    if items:
+        return {"updated_type": "music_items_updated", "items": [to_safe_item(item) for item in items.values()]}
+    return None
 
 
 # --- Utility Functions ---
 
+def to_safe_item(item: Dict) -> Dict[str, Union[str, int, list]]:
+    """把索引条目转换为可 JSON 序列化的 web 格式 (不含 Path)"""
+    return {
+        "type": item["type"],
+        "name": item["name"],  # 播放列表的完整相对路径
+        "music": list(item.get("music", ())),
+        "song_count": len(item.get("music", [])) if item["type"] == "playlist" else 1
+    }
+
+
+def jsonify(data: Any) -> Response:
+    """序列化 REST 响应 (orjson，客户端支持时使用 MessagePack)"""
+    body, mimetype = encode_for(request.headers.get("Accept", ""), data)
+    return Response(body, mimetype=mimetype)
+
+
+# 播放器状态使用短键名，减少每次推送的字节数 (web 端 script.js 中有对应的解析)
+PLAYER_SHORT_KEYS = {
+    "status": "s",
+    "playlist_name": "l",
+    "current_music": "m",
+    "current_time": "t",
+    "total_time": "d",
+    "playback_mode": "o",
+    "playback_mode_text": "ot",
+    "current_volume": "v",
+}
+
+
+def compact_player(player_data: Dict[str, Any]) -> Dict[str, Any]:
+    """把播放器状态转换为短键名格式 (不向 web 暴露服务器路径)"""
+    return {short: player_data.get(key) for key, short in PLAYER_SHORT_KEYS.items()}
+
+
 def get_player_data() -> Dict[str, Union[str, list[str]]]:
     """获取播放器状态 (兼容 web 界面)"""
     try:
         player_data = get_player()
-        return {"updated_type": "player_status_updated", "data": player_data}
+        return {"updated_type": "player_status_updated", "data": compact_player(player_data)}
     except Exception as e:
         return {"updated_type": "player_status_updated", "error": f"获取播放器状态失败: {str(e)}"}
 
 
 def get_music_data() -> Dict[str, Union[str, List[Dict]]]:
     """获取音乐列表 (兼容 web 界面)"""
-    # 此函数会调用 tools.py 中的 get_music()，它现在依赖缓存。
+    # 读取当前索引快照 (不触发扫描)，同一快照只构建一次 web 列表
     try:
-        # 不带参数调用 get_music()，它将返回缓存数据
-        music_list = get_music()
-        safe_music_list = []
-        if music_list:
-            for item in music_list:
-                safe_item = {
-                    "type": item["type"],
-                    "name": item["name"],  # 播放列表的完整相对路径
-                    "music": item.get("music", []),
-                    "song_count": len(item.get("music", [])) if item["type"] == "playlist" else 1
-                }
-                safe_music_list.append(safe_item)
-
-        return {"updated_type": "music_list_updated", "music_list": safe_music_list}
+        return get_library().memo("web", _build_music_data)
     except Exception as e:
         return {"updated_type": "music_list_updated", "error": f"获取音乐列表失败: {str(e)}"}
 
 
+def _build_music_data(library) -> Dict[str, Union[str, List[Dict]]]:
+    return {"updated_type": "music_list_updated", "music_list": [to_safe_item(item) for item in library.items]}
+
+
+def cached_response(variants: Dict[str, bytes], content_type: str, etag: str, cache_control: str) -> Response:
+    """带 ETag 和压缩协商的响应，命中条件请求时直接返回 304"""
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(b"", status=304, headers=headers)
+    body, encoding = select_variant(variants, request.headers.get("Accept-Encoding", ""))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, headers=headers, content_type=content_type)
+
+
+@app.template_global()
+def static_url(filename: str) -> str:
+    """带内容哈希的静态资源 URL，文件变化后 URL 随之变化"""
+    version = assets.version(filename)
+    if version:
+        return url_for('static', filename=filename, v=version)
+    return url_for('static', filename=filename)
+
+
 # --- Routes ---
 
+_index_cache: Dict[str, Any] = {}
+
+
 @app.route('/')
-def index():
-    """主页"""
-    return render_template('index.html')
+async def index():
+    """主页 (模板只依赖静态资源版本，渲染一次后缓存)"""
+    if not _index_cache:
+        html = (await render_template('index.html')).encode()
+        _index_cache["variants"] = compress_variants(html)
+        _index_cache["etag"] = f'"{hashlib.sha256(html).hexdigest()[:12]}"'
+    return cached_response(_index_cache["variants"], "text/html; charset=utf-8", _index_cache["etag"],
+                           REVALIDATE_CACHE)
+
+
+@app.route('/static/<path:filename>')
+async def static(filename: str):
+    """预压缩的静态资源；带正确版本参数的请求可永久缓存"""
+    asset = assets.get(filename)
+    if asset is None:
+        return Response("Not Found", status=404)
+    cache_control = IMMUTABLE_CACHE if request.args.get("v") == asset.digest else REVALIDATE_CACHE
+    return cached_response(asset.variants, asset.mimetype, asset.etag, cache_control)
+
+
+@app.route('/api/music')
+async def music_route():
+    """音乐库 JSON，支持 ETag 条件请求 (索引未变化时返回 304，不重新序列化)"""
+    accept = request.headers.get("Accept", "")
+    fmt = "msgpack" if MSGPACK_MIMETYPE in accept else "json"
+    library = get_library()
+    etag = f'"lib-{library.version}-{fmt}"'
+
+    def build(_):
+        # 与 ETag 使用同一个快照，避免版本号与内容不一致
+        body, content_type = encode_for(accept, library.memo("web", _build_music_data))
+        return compress_variants(body), content_type
+
+    variants, content_type = library.memo(("api", fmt), build)
+    return cached_response(variants, content_type, etag, REVALIDATE_CACHE)
 
 
 @app.route('/api/download', methods=['POST'])
-def download_route():
+async def download_route():
     """处理下载请求 (Web API)"""
-    data = request.json
+    data = await request.get_json()
     url = data.get('url')
     playlist = data.get('playlist')
 
@@ -96,7 +259,7 @@ def download_route():
         folder_path = get_path(music_dir, playlist, "%(title)s.%(ext)s") if playlist else get_path(music_dir,
                                                                                                    filename="%(title)s.%(ext)s")
 
-        download_task.put({"id": task_id, "url": valid_url, "folder": folder_path})
+        add_task(task_id, valid_url, folder_path)
 
         return jsonify({"success": True, "message": "下载任务已添加", "id": task_id})
     except Exception as e:
@@ -104,10 +267,45 @@ def download_route():
         return jsonify({"success": False, "message": f"添加下载任务失败: {str(e)}"}), 500
 
 
+@app.route('/metrics')
+async def metrics_route():
+    """Prometheus 指标"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route('/api/diagnostics')
+async def diagnostics_route():
+    """卡顿诊断数据：最近的语音帧读取和事件循环延迟"""
+    stats = snapshot()
+    stats["diagnosis"] = diagnose(stats)
+    return jsonify(stats)
+
+
+@app.route('/api/preview/<path:name>')
+async def preview_route(name: str):
+    """
+    试听音乐库中的歌曲：支持 Range 请求 (可拖动进度)。
+    文件由 Quart (aiofiles) 在线程池中按 8 KB 分块读取后经 ASGI 发送，不整体载入内存；不是 sendfile 零拷贝。
+    """
+    found_item = find_music(name)
+    if not found_item or found_item["type"] == "playlist":
+        return jsonify({"success": False, "message": f"未找到歌曲：`{name}`"}), 404
+
+    path = found_item["path"] if found_item["type"] == "playlist_song" else found_item["paths"][0]
+    if not path.is_file():
+        return jsonify({"success": False, "message": f"文件不存在：`{name}`"}), 404
+
+    # conditional=True 时 Quart 处理 Range / If-Range 并返回 206 部分内容
+    response = await send_file(path, mimetype=mimetypes.guess_type(path.name)[0] or "audio/mpeg", conditional=True)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Cache-Control"] = REVALIDATE_CACHE
+    return response
+
+
 @app.route('/api/delete_music', methods=['POST'])
-def delete_music_route():
+async def delete_music_route():
     """处理删除请求 (Web API)"""
-    data = request.json
+    data = await request.get_json()
     name = data.get('name')
 
     if not name:
@@ -115,7 +313,8 @@ def delete_music_route():
 
     try:
         # 这里需要调用 get_music() 确保删除逻辑基于最新的文件列表
-        music_data = get_music(check="force_rescan")  # 删除前强制刷新索引
+        # 扫描和删除文件都在线程池中执行，不阻塞事件循环
+        music_data = await run_blocking(get_music, "force_rescan")  # 删除前强制刷新索引
         if not music_data:
             return jsonify({"success": False, "message": f"未找到 `{name}`"}), 404
 
@@ -124,18 +323,17 @@ def delete_music_route():
         is_playlist_song = "/" in name
 
         # 检查是否正在播放
-        if check_music_open(name):
+        if await run_blocking(check_music_open, name):
             return jsonify({"success": False, "message": f"`{name}` 正在播放中，请先停止播放。"}), 400
 
         if is_playlist:
             # 删除整个播放列表
             path_to_delete = get_path(music_dir, subfolder=name)
             if path_to_delete.exists():
-                shutil.rmtree(path_to_delete)
+                await run_blocking(shutil.rmtree, path_to_delete)
                 edit_play_queue(playlist=name)
-                # 删除后，强制刷新索引并通知 Web 客户端
-                get_music(check="force_rescan")
-                threading.Thread(target=lambda: socketio.emit("update_status", get_music_data())).start()
+                # 删除后，强制刷新索引 (library_changed 事件会通知 Web 客户端)
+                await run_blocking(get_music, "force_rescan")
                 return jsonify({"success": True, "message": f"已删除播放列表: {name}", "deleted_type": "playlist"})
             else:
                 return jsonify({"success": False, "message": f"播放列表目录不存在: {name}"}), 404
@@ -146,11 +344,10 @@ def delete_music_route():
             if found_music and found_music['paths']:
                 path_to_delete = found_music['paths'][0]
                 if path_to_delete.exists():
-                    os.remove(path_to_delete)
+                    await run_blocking(os.remove, path_to_delete)
                     edit_play_queue(music=path_to_delete)
-                    # 删除后，强制刷新索引并通知 Web 客户端
-                    get_music(check="force_rescan")
-                    threading.Thread(target=lambda: socketio.emit("update_status", get_music_data())).start()
+                    # 删除后，强制刷新索引 (library_changed 事件会通知 Web 客户端)
+                    await run_blocking(get_music, "force_rescan")
                     return jsonify({"success": True, "message": f"已删除单曲: {name}", "deleted_type": "song"})
                 else:
                     return jsonify({"success": False, "message": f"文件不存在: {name}"}), 404
@@ -168,14 +365,13 @@ def delete_music_route():
                         if s_name == song_name:
                             path_to_delete = m['paths'][i]
                             if path_to_delete.exists():
-                                os.remove(path_to_delete)
+                                await run_blocking(os.remove, path_to_delete)
                                 edit_play_queue(music=path_to_delete)
                                 found_song = True
                                 break
                     if found_song:
-                        # 删除后，强制刷新索引并通知 Web 客户端
-                        get_music(check="force_rescan")
-                        threading.Thread(target=lambda: socketio.emit("update_status", get_music_data())).start()
+                        # 删除后，强制刷新索引 (library_changed 事件会通知 Web 客户端)
+                        await run_blocking(get_music, "force_rescan")
                         return jsonify({"success": True, "message": f"已删除 {playlist_name} 中的歌曲: {song_name}",
                                         "deleted_type": "playlist_song"})
 
@@ -192,60 +388,94 @@ def delete_music_route():
 # --- SocketIO and Background Tasks ---
 
 @socketio.on('connect')
-def handle_connect():
+async def handle_connect(sid, environ, auth=None):
     """处理客户端连接"""
-    connected_sids.add(request.sid)
+    connected_sids.add(sid)
+    for room in ROOMS:
+        await socketio.enter_room(sid, room)
     # 首次连接时发送最新的音乐和播放器状态
-    socketio.emit("update_status", get_player_data(), to=request.sid)
-    socketio.emit("update_status", get_music_data(), to=request.sid)
-    print(f"SocketIO Client connected: {request.sid}")
+    await socketio.emit("update_status", get_player_data(), to=sid)
+    await socketio.emit("update_status", get_music_data(), to=sid)
+    print(f"SocketIO Client connected: {sid}")
+
+
+@socketio.on('subscribe')
+async def handle_subscribe(sid, rooms):
+    """客户端选择需要接收的主题房间，例如 ["player"]"""
+    wanted = set(rooms or ()) & set(ROOMS)
+    for room in ROOMS:
+        if room in wanted:
+            await socketio.enter_room(sid, room)
+        else:
+            await socketio.leave_room(sid, room)
 
 
 @socketio.on('disconnect')
-def handle_disconnect():
+async def handle_disconnect(sid, *args):
     """处理客户端断开连接"""
-    connected_sids.discard(request.sid)
-    print(f"SocketIO Client disconnected: {request.sid}")
-
+    connected_sids.discard(sid)
+    print(f"SocketIO Client disconnected: {sid}")
 
-def update_status_thread():
-    """每隔 0.5 秒推送一次播放器状态更新，【不再轮询音乐列表】"""
-    last_player_data = {}
 
-    with app.app_context():
-        while True:
-            # 1. 播放器状态检查 (每 0.5 秒)
-            try:
-                current_player_data = get_player()
-                data = {"updated_type": "player_status_updated", "data": current_player_data}
-            except Exception as e:
-                data = {"updated_type": "player_status_updated", "error": str(e)}
-
-            if current_player_data != last_player_data:
-                for sid in list(connected_sids):
-                    socketio.emit("update_status", data, to=sid)
-                last_player_data = current_player_data
+# --- Main Execution ---
 
-            # 【注意：音乐列表轮询逻辑已移除】
+@app.before_serving
+async def mark_web_ready():
+    startup.mark("web_ready")
 
-            socketio.sleep(0.5)
 
+# 所有路由注册完成后统一包装剖析
+profile_routes(app)
 
-# --- Main Execution ---
 
-# 启动状态更新线程
-threading.Thread(target=update_status_thread, daemon=True).start()
-
-if __name__ == '__main__':
-    # 启动 Flask 和 SocketIO
-    print("等待音乐索引初始化...")
-    # 1. 首次启动时先进行一次音乐扫描，填充索引 (只执行一次)
+def load_index():
+    """后台加载音乐索引 (不阻塞 web 服务启动)"""
     get_music(check="force_rescan")
-    print("音乐索引初始化完成，启动 Discord Bot。")
-
-    # 2. 启动 Discord Bot 线程 (确保在 music index 初始化后)
-    dc.start()
+    startup.mark("index_loaded")
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop, shutdown: asyncio.Event):
+    """收到 SIGINT/SIGTERM (Ctrl-C、systemctl stop) 时触发 shutdown 事件"""
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, shutdown.set)
+        except NotImplementedError:
+            # Windows 的事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(shutdown.set))
+
+
+async def main():
+    """启动顺序：所有后台任务都从这里显式启动，在同一个事件循环中运行 Web 服务和 Discord Bot"""
+    startup.mark("imports")
+    loop = asyncio.get_running_loop()
+    broadcaster.attach(loop)
+    install_audit_hook()
+    dc_extra.apply_patches()
+    # 静态资源启动时预压缩
+    assets.load()
+
+    # 1. 下载线程 (会先恢复未完成的下载任务)；读取上次的播放状态，bot 就绪后恢复播放
+    downloader.start()
+    player_state.start()
+    # 2. 音乐索引在线程池中加载；加载完成前 web 服务已可响应
+    loop.run_in_executor(None, load_index)
+    # 3. 监控事件循环是否被同步操作阻塞
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+
+    # 4. Web 服务与 Bot 共享事件循环；Bot 登录失败不影响 Web 服务
+    # SIGINT/SIGTERM 由这里统一处理 (不让 Hypercorn 自行安装)，同时停止 Web 服务和 Bot
+    shutdown = asyncio.Event()
+    install_signal_handlers(loop, shutdown)
+    config = Config()
+    config.bind = [f"0.0.0.0:{os.getenv('PORT') or 5000}"]
+    bot_task = asyncio.create_task(dc.run_bot())
+    try:
+        await serve(asgi_app, config, shutdown_trigger=shutdown.wait)
+    finally:
+        lag_monitor.cancel()
+        await dc.bot.close()
+        await bot_task
 
-    print("DEBUG: 已切换到手动刷新机制监控音乐目录。")
 
-    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
\ No newline at end of file
+if __name__ == '__main__':
+    asyncio.run(main())
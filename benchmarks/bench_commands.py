@@ -0,0 +1,167 @@
+# benchmarks/bench_commands.py
+"""
+斜杠命令延迟基准：用 FakeInteraction 直接调用 dc_command 中注册的命令回调 (不连接 Discord)，
+记录从收到交互到第一次回应 (defer / send_message) 和到第一条 followup 的时间。
+
+每轮依次执行：/play 的自动补全 (逐字输入) → /play <播放列表> → /status → /seek → /next。
+音乐库默认用 ffmpeg 生成的测试音频 (硬链接复用)，也可以用 --music-dir 指向真实音乐库。
+
+用法：
+    python benchmarks/bench_commands.py [--rounds 10] [--music-dir 路径] [--output result.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT, make_tone, summarize, write_results, compare
+
+_workdir = Path(tempfile.mkdtemp(prefix="bench_commands_"))
+os.environ["MUSIC_DIR"] = str(_workdir)
+os.environ["DOWNLOAD_DB"] = str(_workdir / "downloads.db")
+
+import tools  # noqa: E402
+import dc_command  # noqa: E402
+from dc_config import music_player  # noqa: E402
+from fakes import FakeGuild, FakeInteraction, FakeVoiceChannel  # noqa: E402
+from dc_extra import apply_patches  # noqa: E402
+
+apply_patches()
+
+
+def build_fixture(root: Path, singles: int, playlists: int, per_playlist: int, seconds: float):
+    """生成测试音乐库：所有歌曲硬链接到同一段测试音频 (已生成过则复用)"""
+    marker = root / ".complete"
+    if marker.exists():
+        return
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    template = root.with_name(root.name + ".tone.mp3")
+    make_tone(template, seconds)
+
+    targets = [root / f"Single {i:04d}.mp3" for i in range(singles)]
+    for p in range(playlists):
+        folder = root / f"Playlist {p:03d}"
+        folder.mkdir()
+        targets += [folder / f"Track {t:03d}.mp3" for t in range(per_playlist)]
+    for target in targets:
+        try:
+            os.link(template, target)
+        except OSError:
+            shutil.copyfile(template, target)
+    marker.touch()
+
+
+async def invoke(command, guild: FakeGuild, channel: FakeVoiceChannel, **kwargs) -> FakeInteraction:
+    """像 discord.py 分发交互那样调用命令回调，返回带时间线的交互"""
+    interaction = FakeInteraction(guild, channel)
+    await command.callback(interaction, **kwargs)
+    interaction.record("return")
+    return interaction
+
+
+def timings(interactions) -> dict:
+    """汇总：到第一次回应、到第一条 followup、到命令返回"""
+    result = {}
+    for label, kinds in (("first_response", ("defer", "send_message")), ("followup", ("followup",)),
+                         ("total", ("return",))):
+        samples = [value for value in (i.first(*kinds) for i in interactions) if value is not None]
+        if samples:
+            result[label] = summarize(samples)
+    return result
+
+
+async def run(args) -> dict:
+    music_data = tools.get_music(check="force_rescan")
+    playlist = next(item for item in music_data if item["type"] == "playlist")
+    query = playlist["music"][-1]
+    autocomplete = dc_command.play_command._params["name"].autocomplete
+
+    guild = FakeGuild()
+    channel = FakeVoiceChannel(guild)
+    commands = {name: [] for name in ("play", "status", "seek", "next")}
+    keystrokes = []
+
+    for _ in range(args.rounds):
+        music_player.play_queue = []
+        music_player.current_track_index = 0
+
+        # 自动补全：每次按键一次交互
+        for length in range(1, len(query) + 1):
+            interaction = FakeInteraction(guild, channel)
+            await autocomplete(interaction, query[:length])
+            keystrokes.append(time.perf_counter() - interaction.created)
+
+        commands["play"].append(await invoke(dc_command.play_command, guild, channel, name=playlist["name"]))
+        await asyncio.sleep(args.settle)
+        commands["status"].append(await invoke(dc_command.status_command, guild, channel))
+        commands["seek"].append(await invoke(dc_command.seek_command, guild, channel, seek_time=args.seek))
+        await asyncio.sleep(args.settle)
+        commands["next"].append(await invoke(dc_command.next_command, guild, channel))
+        await asyncio.sleep(args.settle)
+
+    # 停止播放，不触发自动切歌
+    music_player.manual_skip = True
+    if guild.voice_client:
+        guild.voice_client.stop()
+    await asyncio.sleep(0.2)
+
+    results = {name: timings(interactions) for name, interactions in commands.items()}
+    results["autocomplete"] = {"keystroke": summarize(keystrokes)}
+    # 第一次 /play 包含连接语音频道，单独列出
+    results["play"]["first_call"] = {kind: round(elapsed * 1000, 3) for kind, elapsed, _ in
+                                     commands["play"][0].timeline}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--music-dir", help="使用真实音乐库 (需包含至少一个播放列表)")
+    parser.add_argument("--singles", type=int, default=50)
+    parser.add_argument("--playlists", type=int, default=20)
+    parser.add_argument("--per-playlist", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=60, help="测试音频长度")
+    parser.add_argument("--seek", default="0:30")
+    parser.add_argument("--settle", type=float, default=0.5, help="命令之间的间隔 (秒)")
+    parser.add_argument("--data-dir", default=str(ROOT / "benchmarks" / ".data"))
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    if args.music_dir:
+        tools.music_dir = args.music_dir
+    else:
+        root = Path(args.data_dir) / f"commands_{args.singles}_{args.playlists}x{args.per_playlist}"
+        build_fixture(root, args.singles, args.playlists, args.per_playlist, args.seconds)
+        tools.music_dir = str(root)
+
+    # 命令和播放会打印调试信息，测量期间丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args))
+
+    print(f"{'command':<14}{'first response p50':>20}{'followup p50':>16}{'followup p95':>16}")
+    for name in ("play", "status", "seek", "next"):
+        result = results[name]
+        first = result.get("first_response", {}).get("median_ms", float("nan"))
+        followup = result.get("followup", {})
+        print(f"{name:<14}{first:>17.2f} ms{followup.get('median_ms', float('nan')):>13.2f} ms"
+              f"{followup.get('p95_ms', float('nan')):>13.2f} ms")
+    print(f"autocomplete  每次按键 p50 {results['autocomplete']['keystroke']['median_ms']:.3f} ms, "
+          f"p95 {results['autocomplete']['keystroke']['p95_ms']:.3f} ms")
+
+    shutil.rmtree(_workdir, ignore_errors=True)
+    if args.output:
+        write_results(args.output, "commands", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# benchmarks/bench_library.py
+"""
+音乐库基准：在合成的音乐目录上测量全量扫描、/play 名称查找、自动补全每次按键的耗时、
+get_music_data 序列化以及 edit_play_queue。
+
+目录结构：
+    flat    — 10% 根目录单曲，其余每 100 首一个一级播放列表
+    nested  — 10% 根目录单曲，其余放在 艺术家/专辑/碟 三级嵌套目录中
+所有歌曲都是指向同一个极小静音 mp3 的硬链接 (不支持时复制)，生成一次后会复用。
+
+用法：
+    python benchmarks/bench_library.py [--sizes 1000,10000,100000] [--layouts flat,nested]
+                                       [--output result.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT, measure, summarize, write_results, compare
+
+# 必须在导入项目模块之前设置 (tools 在导入时读取 MUSIC_DIR)
+_workdir = tempfile.mkdtemp(prefix="bench_library_")
+os.environ["MUSIC_DIR"] = _workdir
+os.environ["DOWNLOAD_DB"] = os.path.join(_workdir, "downloads.db")
+
+import tools  # noqa: E402
+from dc_config import music_player  # noqa: E402
+from dc_extra import autocomplete_music_callback  # noqa: E402
+from app import get_music_data, _build_music_data  # noqa: E402
+from serializer import dumps  # noqa: E402
+
+PLAYLIST_SIZE = 100
+SINGLE_RATIO = 0.1
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz 的帧头 + 全零数据 (静音)，约 0.1 秒
+SILENT_MP3 = (b"\xff\xfb\x90\x64" + b"\x00" * 413) * 4
+QUERY = "song 0000999"
+
+
+def song_name(index: int) -> str:
+    return f"Song {index:07d} (Official Audio)"
+
+
+def build_tree(root: Path, files: int, layout: str):
+    """生成合成音乐目录 (已生成过则直接复用)"""
+    marker = root / ".complete"
+    if marker.exists():
+        return
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    # 模板放在目录外，避免被扫描为一首歌
+    template = root.with_name(root.name + ".silent.mp3")
+    template.write_bytes(SILENT_MP3)
+
+    singles = int(files * SINGLE_RATIO)
+    for index in range(files):
+        if index < singles:
+            folder = root
+        else:
+            group = (index - singles) // PLAYLIST_SIZE
+            if layout == "flat":
+                folder = root / f"Playlist {group:05d}"
+            else:
+                folder = root / f"Artist {group // 100:03d}" / f"Album {group // 10 % 10:02d}" / f"Disc {group % 10}"
+        folder.mkdir(parents=True, exist_ok=True)
+        target = folder / f"{song_name(index)}.mp3"
+        try:
+            os.link(template, target)
+        except OSError:
+            shutil.copyfile(template, target)
+    marker.touch()
+
+
+def run_sync(coro):
+    """驱动不含真正等待的协程 (避免把 asyncio.run 的开销计入按键延迟)"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("协程在基准中发生了挂起")
+
+
+def bench_tree(root: Path, repeat: int, lookups: int) -> dict:
+    tools.music_dir = str(root)
+    quiet = io.StringIO()
+    results = {}
+
+    # 1. 全量扫描
+    with contextlib.redirect_stdout(quiet):
+        results["scan"] = measure(lambda: tools.get_music("force_rescan"), repeat)
+        music_data = tools.get_music()
+
+    singles = [item for item in music_data if item["type"] == "mp3"]
+    playlists = [item for item in music_data if item["type"] == "playlist"]
+    all_paths = [path for item in music_data for path in item["paths"]]
+    results["items"] = {"songs": len(all_paths), "playlists": len(playlists)}
+
+    # 2. /play 的名称查找 (最好、最坏和未命中)
+    names = {
+        "first_single": singles[0]["name"],
+        "last_single": singles[-1]["name"],
+        "last_playlist_song": f"{playlists[-1]['name']}/{playlists[-1]['music'][-1]}",
+        "playlist": playlists[-1]["name"],
+        "missing": "no such song",
+    }
+    results["lookup"] = {
+        label: measure(lambda name=name: tools.find_music(name), lookups)
+        for label, name in names.items()
+    }
+
+    # 3. 自动补全：模拟逐字输入，每次按键调用一次
+    autocomplete = autocomplete_music_callback(include_music=True, include_playlist_music=True)
+    per_key = {}
+    samples = []
+    for length in range(len(QUERY) + 1):
+        prefix = QUERY[:length]
+        start = time.perf_counter()
+        run_sync(autocomplete(None, prefix))
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        per_key[prefix or "<empty>"] = round(elapsed * 1000, 4)
+    results["autocomplete"] = {"keystrokes": summarize(samples), "per_key_ms": per_key}
+
+    # 4. web 音乐列表：构建 + 序列化 (get_music_data 按快照缓存，build 绕过缓存测量实际构建)
+    payload = get_music_data()
+    results["music_data"] = {
+        "build": measure(lambda: _build_music_data(tools.get_library()), repeat),
+        "cached": measure(get_music_data, repeat),
+        "encode": measure(lambda: dumps(payload), repeat),
+        "bytes": len(dumps(payload)),
+    }
+
+    # 5. edit_play_queue：整个队列为全部歌曲时移除一个播放列表 / 一首歌
+    def fill_queue():
+        music_player.play_queue = list(all_paths)
+        music_player.current_track_index = 0
+
+    results["edit_play_queue"] = {
+        "remove_playlist": measure(lambda: tools.edit_play_queue(playlist=playlists[0]["name"]), repeat,
+                                   setup=fill_queue),
+        "remove_song": measure(lambda: tools.edit_play_queue(music=all_paths[-1]), repeat, setup=fill_queue),
+    }
+    music_player.play_queue = []
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--layouts", default="flat,nested")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--data-dir", default=str(ROOT / "benchmarks" / ".data"), help="合成音乐目录的缓存位置")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    results = {}
+    for layout in args.layouts.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            root = Path(args.data_dir) / f"{layout}_{size}"
+            print(f"准备 {root} ...")
+            build_tree(root, size, layout)
+            result = bench_tree(root, args.repeat, args.lookups)
+            results[f"{layout}_{size}"] = result
+            print(f"{layout:<8}{size:>8}  scan {result['scan']['median_ms']:>10.2f} ms  "
+                  f"lookup(miss) {result['lookup']['missing']['median_ms']:>8.3f} ms  "
+                  f"autocomplete p95 {result['autocomplete']['keystrokes']['p95_ms']:>8.3f} ms  "
+                  f"music_data {result['music_data']['build']['median_ms']:>8.2f} ms  "
+                  f"edit_queue {result['edit_play_queue']['remove_playlist']['median_ms']:>8.2f} ms")
+
+    shutil.rmtree(_workdir, ignore_errors=True)
+    if args.output:
+        write_results(args.output, "library", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# benchmarks/bench_memory.py
+"""
+音乐库索引内存基准：比较原先的 dict 条目 (每首歌一个 Path 和一份歌曲名列表) 与 library.py 的紧凑列式条目。
+
+不访问文件系统：直接生成与 bench_library 相同命名和目录结构的文件列表，交给两种实现构建索引。
+内存用 tracemalloc 统计构建完成、丢弃扫描结果后仍被索引持有的字节数 (含名称查找索引和 web 列表)。
+查找耗时使用与 tools.find_music 相同的逻辑，确认紧凑表示没有让查找变慢。
+
+用法：
+    python benchmarks/bench_memory.py [--sizes 100000,1000000] [--layouts flat,nested] [--output result.json]
+"""
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from common import measure, write_results, compare
+
+from library import build_items
+
+PLAYLIST_SIZE = 100
+SINGLE_RATIO = 0.1
+ROOT_DIR = Path("/srv/music")
+
+
+def song_name(index: int) -> str:
+    return f"Song {index:07d} (Official Audio)"
+
+
+def synthetic_files(files: int, layout: str) -> List[Path]:
+    """与 bench_library.build_tree 相同的目录结构，只生成路径"""
+    singles = int(files * SINGLE_RATIO)
+    paths = []
+    for index in range(files):
+        if index < singles:
+            folder = ROOT_DIR
+        else:
+            group = (index - singles) // PLAYLIST_SIZE
+            if layout == "flat":
+                folder = ROOT_DIR / f"Playlist {group:05d}"
+            else:
+                folder = ROOT_DIR / f"Artist {group // 100:03d}" / f"Album {group // 10 % 10:02d}" / f"Disc {group % 10}"
+        paths.append(folder / f"{song_name(index)}.mp3")
+    return paths
+
+
+def legacy_items(music_path: Path, files: List[Path]) -> List[Dict]:
+    """改动前的 get_music：单曲和播放列表都是 dict，每首歌保存一个 Path，播放列表另存歌曲名列表"""
+    music, playlists = [], {}
+    for file_path in files:
+        try:
+            relative_path = file_path.relative_to(music_path)
+        except ValueError:
+            continue
+        relative_dir_path = relative_path.parent
+        if relative_dir_path != Path('.'):
+            playlist_name = str(relative_dir_path).replace(os.path.sep, '/')
+            if playlist_name not in playlists:
+                playlists[playlist_name] = {"type": "playlist", "name": playlist_name, "music": [], "paths": []}
+            playlists[playlist_name]["music"].append(file_path.stem)
+            playlists[playlist_name]["paths"].append(file_path)
+        else:
+            music.append({"type": "mp3", "name": file_path.stem, "paths": [file_path]})
+    for data in playlists.values():
+        music.append(dict(data, music_count=len(data["music"])))
+    return music
+
+
+def compact_items(music_path: Path, files: List[Path]):
+    items, _ = build_items(music_path, files)
+    return items
+
+
+def name_index(items) -> tuple:
+    """与 tools._name_index 相同"""
+    by_name, playlists = {}, {}
+    for item in items:
+        by_name.setdefault(item["name"], item)
+        if item["type"] == "playlist":
+            playlists.setdefault(item["name"], item)
+    return by_name, playlists
+
+
+def legacy_find(index: tuple, name: str):
+    """改动前 tools.find_music 的列表内查找 (dict 条目)"""
+    by_name, playlists = index
+    if "/" in name:
+        playlist_name, song_name_stem = name.rsplit("/", 1)
+        item = playlists.get(playlist_name)
+        if item and song_name_stem in item["music"]:
+            song_index = item["music"].index(song_name_stem)
+            return {"type": "playlist_song", "name": song_name_stem, "path": item["paths"][song_index],
+                    "playlist_name": playlist_name}
+    return by_name.get(name)
+
+
+def compact_find(index: tuple, name: str):
+    """与 tools.find_music 相同"""
+    by_name, playlists = index
+    if "/" in name:
+        playlist_name, song_name_stem = name.rsplit("/", 1)
+        item = playlists.get(playlist_name)
+        path = item.song_path(song_name_stem) if item else None
+        if path:
+            return {"type": "playlist_song", "name": song_name_stem, "path": path, "playlist_name": playlist_name}
+    return by_name.get(name)
+
+
+def music_list(items) -> List[Dict]:
+    """与 app.to_safe_item 相同的 web 列表"""
+    return [{"type": item["type"], "name": item["name"], "music": list(item.get("music", ())),
+             "song_count": len(item.get("music", ())) if item["type"] == "playlist" else 1} for item in items]
+
+
+def retained(build: Callable[[], object], files: int, layout: str) -> tuple:
+    """生成文件列表并构建，返回 (对象, 丢弃文件列表后仍持有的字节数, 构建峰值字节数, 构建耗时)"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    paths = synthetic_files(files, layout)
+    start = time.perf_counter()
+    result = build(paths)
+    elapsed = time.perf_counter() - start
+    del paths
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current - baseline, peak - baseline, elapsed
+
+
+def bench(files: int, layout: str, lookups: int) -> Dict:
+    results = {}
+    for label, builder, find in (("legacy", legacy_items, legacy_find), ("compact", compact_items, compact_find)):
+        items, index_bytes, peak_bytes, build_seconds = retained(lambda paths: builder(ROOT_DIR, paths), files, layout)
+
+        tracemalloc.start()
+        index = name_index(items)
+        lookup_bytes = tracemalloc.get_traced_memory()[0]
+        payload = music_list(items)
+        payload_bytes = tracemalloc.get_traced_memory()[0] - lookup_bytes
+        tracemalloc.stop()
+
+        singles = [item for item in items if item["type"] == "mp3"]
+        playlists = [item for item in items if item["type"] == "playlist"]
+        last = playlists[-1]
+        names = {
+            "last_single": singles[-1]["name"],
+            "last_playlist_song": f"{last['name']}/{last['music'][-1]}",
+            "playlist": last["name"],
+            "missing": "no such song",
+        }
+        results[label] = {
+            "memory": {
+                "index_mb": round(index_bytes / 2 ** 20, 2),
+                "bytes_per_song": round(index_bytes / files, 1),
+                "build_peak_mb": round(peak_bytes / 2 ** 20, 2),
+                "name_index_mb": round(lookup_bytes / 2 ** 20, 2),
+                "music_list_mb": round(payload_bytes / 2 ** 20, 2),
+            },
+            "build_ms": round(build_seconds * 1000, 2),
+            "lookup": {name_label: measure(lambda name=name: find(index, name), lookups)
+                       for name_label, name in names.items()},
+            # /play 播放列表：取出整个列表的路径作为队列
+            "queue": measure(lambda: list(last["paths"]), lookups),
+        }
+        del items, index, payload, singles, playlists, last, names
+        gc.collect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--layouts", default="flat,nested")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'':<16}{'':<9}{'index MB':>10}{'B/song':>9}{'list MB':>9}{'build ms':>10}"
+          f"{'song lookup':>13}{'miss':>9}{'queue':>9}")
+    for layout in args.layouts.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            result = results[f"{layout}_{size}"] = bench(size, layout, args.lookups)
+            for label, data in result.items():
+                memory = data["memory"]
+                print(f"{layout + '_' + str(size):<16}{label:<9}{memory['index_mb']:>10.1f}"
+                      f"{memory['bytes_per_song']:>9.0f}{memory['music_list_mb']:>9.1f}{data['build_ms']:>10.0f}"
+                      f"{data['lookup']['last_playlist_song']['median_ms'] * 1000:>10.2f} us"
+                      f"{data['lookup']['missing']['median_ms'] * 1000:>6.2f} us"
+                      f"{data['queue']['median_ms'] * 1000:>6.0f} us")
+
+    if args.output:
+        write_results(args.output, "memory", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
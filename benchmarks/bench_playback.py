@@ -0,0 +1,188 @@
+# benchmarks/bench_playback.py
+"""
+离线播放基准：用进程内的 FakeVoiceClient 驱动 dc_extra.play_track (不连接 Discord)，测量
+    - 并发 N 路播放时每路的 CPU 占用 (本进程 + ffmpeg 子进程)、首帧时间和发送节拍延迟
+    - 切歌间隔 (上一首最后一帧到下一首第一帧)
+    - 跳转延迟 (调用 play_track(seek_time=...) 到新音源的第一帧)
+测试音频在本地用 ffmpeg 生成。
+
+用法：
+    python benchmarks/bench_playback.py [--streams 1,4,16] [--seconds 10] [--output result.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import psutil
+
+from common import make_tone, summarize, write_results, compare
+
+_workdir = Path(tempfile.mkdtemp(prefix="bench_playback_"))
+os.environ["MUSIC_DIR"] = str(_workdir)
+os.environ["DOWNLOAD_DB"] = str(_workdir / "downloads.db")
+
+import dc_extra  # noqa: E402
+from dc_config import music_player  # noqa: E402
+from fakes import FakeVoiceClient, load_encoder, FRAME_INTERVAL  # noqa: E402
+
+dc_extra.apply_patches()
+
+
+def cpu_seconds(process: psutil.Process) -> float:
+    """本进程与已结束子进程 (ffmpeg 结束后被回收) 的 CPU 时间总和"""
+    times = process.cpu_times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def start_loop() -> asyncio.AbstractEventLoop:
+    """在后台线程运行事件循环，代替 bot 的主循环接收 after 回调"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def reset_player(queue=None):
+    music_player.play_queue = list(queue or [])
+    music_player.current_track_index = 0
+    music_player.playback_mode = "no_loop"
+    music_player.manual_skip = False
+
+
+def wait_stream(client: FakeVoiceClient, index: int, timeout: float) -> dict:
+    """等待某个客户端的第 index 次播放结束"""
+    deadline = time.perf_counter() + timeout
+    while len(client.streams) <= index:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("等待播放开始超时")
+        time.sleep(0.005)
+    stream = client.streams[index]
+    if not stream["done"].wait(max(0.0, deadline - time.perf_counter())):
+        raise TimeoutError("等待播放结束超时")
+    return stream
+
+
+def bench_concurrency(loop, track: Path, streams: int, seconds: float, encoder_factory) -> dict:
+    """N 路同时播放同一首歌"""
+    reset_player()
+    process = psutil.Process()
+    clients = [FakeVoiceClient(loop, guild_id=i, encoder=encoder_factory()) for i in range(streams)]
+
+    cpu_before = cpu_seconds(process)
+    wall_start = time.perf_counter()
+    requested = []
+    for client in clients:
+        requested.append(time.perf_counter())
+        dc_extra.play_track(client, track)
+    finished = [wait_stream(client, 0, seconds * 3 + 30) for client in clients]
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds(process) - cpu_before
+
+    first_frames = [stream["first_frame"] - start for stream, start in zip(finished, requested)
+                    if stream["first_frame"]]
+    late = [value for stream in finished for value in stream["late"]]
+    frames = sum(stream["frames"] for stream in finished)
+    cores_per_stream = cpu / wall / streams
+    return {
+        "streams": streams,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "cores_per_stream": round(cores_per_stream, 5),
+        "streams_per_core": round(1 / cores_per_stream, 1) if cores_per_stream else None,
+        "first_frame": summarize(first_frames) if first_frames else None,
+        "frames": frames,
+        "late_frames": len(late),
+        "late_over_frame": sum(1 for value in late if value > FRAME_INTERVAL),
+        "lateness": summarize(late) if late else None,
+    }
+
+
+def bench_transition(loop, tracks, repeat: int, encoder) -> dict:
+    """两首短歌顺序播放，测量切歌间隔"""
+    gaps = []
+    for _ in range(repeat):
+        client = FakeVoiceClient(loop, encoder=encoder)
+        reset_player(tracks)
+        dc_extra.play_track(client, tracks[0])
+        first = wait_stream(client, 0, 60)
+        second = wait_stream(client, 1, 60)
+        gaps.append(second["first_frame"] - first["last_frame"])
+    reset_player()
+    return summarize(gaps)
+
+
+def bench_seek(loop, track: Path, repeat: int, encoder, seek_to: int = 5) -> dict:
+    """播放中跳转：与 /seek 一样先设置 manual_skip，再重新 play_track"""
+    latencies = []
+    client = FakeVoiceClient(loop, encoder=encoder)
+    reset_player([track])
+    dc_extra.play_track(client, track)
+    for index in range(1, repeat + 1):
+        time.sleep(0.5)
+        music_player.manual_skip = True
+        start = time.perf_counter()
+        dc_extra.play_track(client, track, seek_time=seek_to)
+        while len(client.streams) <= index or client.streams[index]["first_frame"] is None:
+            time.sleep(0.001)
+        latencies.append(client.streams[index]["first_frame"] - start)
+    music_player.manual_skip = True
+    client.stop()
+    reset_player()
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", default="1,4,16", help="并发路数列表")
+    parser.add_argument("--seconds", type=float, default=10, help="并发测试的音频长度")
+    parser.add_argument("--repeat", type=int, default=5, help="切歌 / 跳转测试次数")
+    parser.add_argument("--no-opus", action="store_true", help="不计入 Opus 编码开销")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    long_track = _workdir / "tone_long.mp3"
+    short_tracks = [_workdir / "tone_a.mp3", _workdir / "tone_b.mp3"]
+    make_tone(long_track, max(args.seconds, 30))
+    make_tone(short_tracks[0], 2, 440)
+    make_tone(short_tracks[1], 2, 660)
+
+    # 先试一次，libopus 不可用时在这里提示，之后不再重复尝试
+    encoder_factory = load_encoder if not args.no_opus and load_encoder() is not None else (lambda: None)
+    loop = start_loop()
+    results = {"concurrency": {}}
+    log = io.StringIO()
+
+    # play_track 会打印调试信息，测量期间丢弃
+    with contextlib.redirect_stdout(log):
+        concurrency_track = _workdir / "tone_concurrency.mp3"
+        make_tone(concurrency_track, args.seconds)
+        for streams in (int(s) for s in args.streams.split(",")):
+            results["concurrency"][str(streams)] = bench_concurrency(loop, concurrency_track, streams, args.seconds,
+                                                                     encoder_factory)
+        results["transition_gap"] = bench_transition(loop, short_tracks, args.repeat, encoder_factory())
+        results["seek_latency"] = bench_seek(loop, long_track, args.repeat, encoder_factory())
+
+    print(f"{'streams':>8}{'cores/stream':>14}{'streams/core':>14}{'first frame p50':>18}{'late>20ms':>11}")
+    for streams, result in results["concurrency"].items():
+        first = result["first_frame"]["median_ms"] if result["first_frame"] else float("nan")
+        print(f"{streams:>8}{result['cores_per_stream']:>14.4f}{result['streams_per_core'] or 0:>14.1f}"
+              f"{first:>15.1f} ms{result['late_over_frame']:>11}")
+    print(f"切歌间隔 median {results['transition_gap']['median_ms']:.1f} ms, "
+          f"跳转延迟 median {results['seek_latency']['median_ms']:.1f} ms")
+
+    loop.call_soon_threadsafe(loop.stop)
+    if args.output:
+        write_results(args.output, "playback", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_serialization.py
+"""
+实时推送 payload 的序列化基准：比较 json / orjson / ormsgpack 的编码耗时和传输字节数。
+
+用法：
+    python benchmarks/bench_serialization.py [--songs 50000] [--repeat 20] [--output result.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from serializer import orjson, ormsgpack  # noqa: E402
+
+# 与 app.PLAYER_SHORT_KEYS 保持一致 (不导入 app，避免依赖 Quart / discord.py)
+PLAYER_SHORT_KEYS = {
+    "status": "s",
+    "playlist_name": "l",
+    "current_music": "m",
+    "current_time": "t",
+    "total_time": "d",
+    "playback_mode": "o",
+    "playback_mode_text": "ot",
+    "current_volume": "v",
+}
+
+
+def build_library_payload(songs: int, playlist_size: int = 100, single_ratio: float = 0.1) -> dict:
+    """构造与 app.get_music_data() 结构相同的音乐库 payload"""
+    singles = int(songs * single_ratio)
+    music_list = [
+        {"type": "mp3", "name": f"单曲 Single Track {i:06d}", "music": [], "song_count": 1}
+        for i in range(singles)
+    ]
+    remaining = songs - singles
+    index = 0
+    while remaining > 0:
+        count = min(playlist_size, remaining)
+        names = [f"歌曲 Song {index:04d}-{j:03d} (Official Audio)" for j in range(count)]
+        music_list.append({"type": "playlist", "name": f"Artist {index:04d}/Album {index:04d}", "music": names,
+                           "song_count": count})
+        remaining -= count
+        index += 1
+    return {"updated_type": "music_list_updated", "music_list": music_list}
+
+
+def build_player_payload(short_keys: bool) -> dict:
+    """构造播放器状态 payload (长键名或短键名)"""
+    data = {
+        "status": "播放中",
+        "playlist_name": "Artist 0001/Album 0001",
+        "current_music": "歌曲 Song 0001-001 (Official Audio)",
+        "current_time": "1:23",
+        "total_time": "4:56",
+        "playback_mode": "loop_all",
+        "playback_mode_text": "🔁 列表循环",
+        "current_volume": "60%",
+    }
+    if short_keys:
+        data = {short: data[key] for key, short in PLAYER_SHORT_KEYS.items()}
+    else:
+        data["current_path"] = "/srv/music/Artist 0001/Album 0001/歌曲 Song 0001-001 (Official Audio).mp3"
+    return {"updated_type": "player_status_updated", "data": data}
+
+
+def encoders() -> dict:
+    """可用的编码器 (stdlib json 对应 Flask-SocketIO / python-socketio 默认行为)"""
+    result = {"json": lambda obj: json.dumps(obj, separators=(',', ':')).encode()}
+    if orjson:
+        result["orjson"] = orjson.dumps
+    if ormsgpack:
+        result["ormsgpack"] = ormsgpack.packb
+    return result
+
+
+def measure(encode, payload, repeat: int) -> dict:
+    """取多次编码中的最短耗时，避免偶发调度抖动"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(payload)
+        best = min(best, time.perf_counter() - start)
+    return {"encode_ms": round(best * 1000, 4), "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    payloads = {
+        f"library_{args.songs}": build_library_payload(args.songs),
+        "player_long_keys": build_player_payload(short_keys=False),
+        "player_short_keys": build_player_payload(short_keys=True),
+    }
+
+    results = {}
+    print(f"{'payload':<22}{'encoder':<12}{'encode ms':>12}{'bytes':>12}")
+    for payload_name, payload in payloads.items():
+        repeat = args.repeat if payload_name.startswith("library") else args.repeat * 100
+        for encoder_name, encode in encoders().items():
+            stats = measure(encode, payload, repeat)
+            results.setdefault(payload_name, {})[encoder_name] = stats
+            print(f"{payload_name:<22}{encoder_name:<12}{stats['encode_ms']:>12.4f}{stats['bytes']:>12}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
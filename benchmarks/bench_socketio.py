@@ -0,0 +1,320 @@
+# benchmarks/bench_socketio.py
+"""
+Socket.IO 面板压测：在子进程中启动 app.asgi_app (不启动 Discord bot)，用大量模拟客户端
+    - 同时连接 (模拟部署后的重连风暴)：连接耗时、收到首屏 (播放器 + 音乐库) 的耗时、失败数
+    - 触发播放器状态变化和音乐库增量更新：广播扇出延迟 (触发到每个客户端收到)
+    - 连续新增多首歌：每个客户端收到的 music_items_updated 条数和条目数 (web 端按条目合并渲染)，
+      合并窗口生效时每个客户端只收到一条包含全部新歌的更新
+    - 服务器 CPU 和每个连接的内存占用
+客户端数逐级增加，连接失败或中途掉线的比例超过阈值时停止，即为当前配置能承受的重连风暴规模。
+
+用法：
+    python benchmarks/bench_socketio.py [--clients 100,500,1000,2000] [--songs 10000] [--output result.json]
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+import psutil
+import socketio
+
+from common import ROOT, summarize, write_results, compare
+
+SERVER_READY_TIMEOUT = 120
+
+
+def raise_fd_limit():
+    """上千个连接需要更多文件描述符 (仅 Unix)"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+# --- 服务器端 (子进程) ---
+
+def serve(port: int, songs: int, data_dir: str):
+    """只运行 web 服务，音乐库使用合成目录，并额外注册一个触发广播的路由"""
+    raise_fd_limit()
+    from bench_library import build_tree
+    root = Path(data_dir) / f"flat_{songs}"
+    build_tree(root, songs, "flat")
+    # 上次运行新增的歌曲会被启动扫描收录，同名文件再次插入时不会产生广播
+    for stale in root.glob("Bench Added *.mp3"):
+        stale.unlink()
+
+    import app
+    import tools
+    from quart import request
+    from dc_config import music_player
+    from events import publish
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    tools.music_dir = str(root)
+    added = {"count": 0}
+
+    @app.app.route("/bench/trigger", methods=["POST"])
+    async def trigger():
+        kind = request.args.get("kind")
+        if kind == "player":
+            # 音量变化会让播放器状态 payload 不同，避免被去重跳过
+            music_player.current_volume = round((music_player.current_volume + 0.01) % 1, 2)
+            publish("player_changed")
+        elif kind == "library":
+            # 新增歌曲 (count 首)，走增量插入 + 合并广播路径
+            for _ in range(int(request.args.get("count", 1))):
+                added["count"] += 1
+                path = root / f"Bench Added {added['count']:06d}.mp3"
+                path.write_bytes(b"\x00")
+                tools.add_music_file(path, {"duration": 0.1})
+        return {"coalesce_delay": app.LIBRARY_COALESCE_DELAY, "clients": len(app.connected_sids)}
+
+    async def main():
+        app.broadcaster.attach(asyncio.get_running_loop())
+        app.assets.load()
+        tools.get_music(check="force_rescan")
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.accesslog = None
+        config.backlog = 4096
+        await hypercorn_serve(app.asgi_app, config)
+
+    asyncio.run(main())
+
+
+# --- 客户端 ---
+
+class LoadClient:
+    """一个模拟的面板客户端：记录每类 update_status 的到达时间"""
+
+    def __init__(self, hub: "Hub"):
+        self.hub = hub
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("update_status", self.on_update)
+        self.sio.on("disconnect", self.on_disconnect)
+        self.initial = set()
+        self.initial_done = asyncio.Event()
+        self.dropped = False
+
+    async def on_disconnect(self, *args):
+        # 主动断开之前收到的 disconnect 说明连接被服务器或心跳超时断开
+        self.dropped = True
+
+    async def on_update(self, data):
+        now = time.perf_counter()
+        updated_type = data.get("updated_type")
+        if not self.initial_done.is_set():
+            self.initial.add(updated_type)
+            if {"player_status_updated", "music_list_updated"} <= self.initial:
+                self.initial_done.set()
+            return
+        self.hub.arrived(updated_type, now, len(data.get("items", ())))
+
+
+class Hub:
+    """汇总所有客户端收到的广播"""
+
+    def __init__(self):
+        self.expect_type = None
+        self.expect_count = 0
+        self.arrivals = []
+        self.items = []
+        self.complete = asyncio.Event()
+
+    def expect(self, updated_type: str, count: int):
+        self.expect_type, self.expect_count = updated_type, count
+        self.arrivals = []
+        self.items = []
+        self.complete = asyncio.Event()
+
+    def arrived(self, updated_type: str, at: float, items: int = 0):
+        if updated_type != self.expect_type:
+            return
+        self.arrivals.append(at)
+        self.items.append(items)
+        if len(self.arrivals) >= self.expect_count:
+            self.complete.set()
+
+
+async def connect_client(client: LoadClient, url: str, transports, timeout: float) -> dict:
+    start = time.perf_counter()
+    try:
+        # connect 默认只等 1 秒命名空间握手，风暴中服务器来不及响应会被误判为失败
+        await asyncio.wait_for(client.sio.connect(url, transports=transports, wait_timeout=timeout), timeout)
+        connected = time.perf_counter()
+        await asyncio.wait_for(client.initial_done.wait(), timeout)
+        return {"ok": True, "connect": connected - start, "initial": time.perf_counter() - start}
+    except Exception as e:
+        return {"ok": False, "error": type(e).__name__}
+
+
+def server_usage(process: psutil.Process) -> dict:
+    times = process.cpu_times()
+    return {"cpu": times.user + times.system, "rss": process.memory_info().rss}
+
+
+async def run_level(url: str, process: psutil.Process, clients: int, broadcasts: int, burst: int, transports,
+                    timeout: float) -> dict:
+    """一个并发级别：连接风暴 + 两类广播"""
+    hub = Hub()
+    before = server_usage(process)
+
+    # 1. 重连风暴：所有客户端同时连接
+    load_clients = [LoadClient(hub) for _ in range(clients)]
+    storm_start = time.perf_counter()
+    outcomes = await asyncio.gather(*(connect_client(c, url, transports, timeout) for c in load_clients))
+    storm = time.perf_counter() - storm_start
+    after_storm = server_usage(process)
+    ok = [o for o in outcomes if o["ok"]]
+    errors = {}
+    for outcome in outcomes:
+        if not outcome["ok"]:
+            errors[outcome["error"]] = errors.get(outcome["error"], 0) + 1
+
+    result = {
+        "clients": clients,
+        "connected": len(ok),
+        "errors": errors,
+        "storm_seconds": round(storm, 3),
+        "connect": summarize([o["connect"] for o in ok]) if ok else None,
+        "initial_payload": summarize([o["initial"] for o in ok]) if ok else None,
+        "storm_server_cpu_seconds": round(after_storm["cpu"] - before["cpu"], 3),
+        "rss_per_connection_kb": round((after_storm["rss"] - before["rss"]) / max(1, len(ok)) / 1024, 1),
+        "server_rss_mb": round(after_storm["rss"] / 1024 / 1024, 1),
+    }
+
+    # 2. 广播扇出
+    async with aiohttp.ClientSession() as session:
+        for kind, updated_type in (("player", "player_status_updated"), ("library", "music_items_updated")):
+            latencies, completes, cpu = [], [], 0.0
+            coalesce_delay = 0.0
+            for _ in range(broadcasts):
+                hub.expect(updated_type, len(ok))
+                usage = server_usage(process)
+                start = time.perf_counter()
+                async with session.post(f"{url}/bench/trigger", params={"kind": kind}) as response:
+                    info = await response.json()
+                if kind == "library":
+                    coalesce_delay = info["coalesce_delay"]
+                try:
+                    await asyncio.wait_for(hub.complete.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                cpu += server_usage(process)["cpu"] - usage["cpu"]
+                latencies.extend(at - start for at in hub.arrivals)
+                if hub.arrivals:
+                    completes.append(max(hub.arrivals) - start)
+                # 让服务器回到空闲，避免两次广播被合并
+                await asyncio.sleep(max(0.2, coalesce_delay * 2))
+            result[f"broadcast_{kind}"] = {
+                "fan_out": summarize(latencies) if latencies else None,
+                "all_clients": summarize(completes) if completes else None,
+                "coalesce_delay_ms": round(coalesce_delay * 1000),
+                "missing": broadcasts * len(ok) - len(latencies),
+                "server_cpu_ms_per_broadcast": round(cpu / broadcasts * 1000, 2),
+            }
+
+        # 3. 连续新增：合并窗口内的多首新歌应合并为每个客户端一条更新
+        hub.expect("music_items_updated", len(ok))
+        async with session.post(f"{url}/bench/trigger", params={"kind": "library", "count": burst}) as response:
+            info = await response.json()
+        try:
+            await asyncio.wait_for(hub.complete.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        # 等待合并窗口过去，统计是否有多余的更新
+        await asyncio.sleep(max(0.2, info["coalesce_delay"] * 2))
+        result["library_burst"] = {
+            "songs": burst,
+            "messages_per_client": round(len(hub.arrivals) / max(1, len(ok)), 2),
+            "items_per_client": round(sum(hub.items) / max(1, len(ok)), 2),
+        }
+
+    # 连接成功后又被断开的客户端 (心跳超时等)，收不到后续广播
+    result["dropped"] = sum(1 for c in load_clients if c.dropped)
+    await asyncio.gather(*(c.sio.disconnect() for c in load_clients), return_exceptions=True)
+    await asyncio.sleep(1)
+    return result
+
+
+async def wait_ready(url: str):
+    deadline = time.perf_counter() + SERVER_READY_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(f"{url}/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError("服务器启动超时")
+
+
+async def run(args) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, __file__, "--serve", "--port", str(args.port),
+                               "--songs", str(args.songs), "--data-dir", args.data_dir],
+                              cwd=str(ROOT), stdout=subprocess.DEVNULL)
+    try:
+        await wait_ready(url)
+        process = psutil.Process(server.pid)
+        transports = args.transports.split(",")
+        results = {"songs": args.songs, "transports": transports, "levels": {}}
+        for clients in (int(c) for c in args.clients.split(",")):
+            level = await run_level(url, process, clients, args.broadcasts, args.burst, transports, args.timeout)
+            results["levels"][str(clients)] = level
+            fan_out = level["broadcast_player"]["fan_out"]
+            print(f"{clients:>6} 客户端  连接成功 {level['connected']:>6}  掉线 {level['dropped']:>5}  风暴 {level['storm_seconds']:>7.2f} s  "
+                  f"首屏 p95 {level['initial_payload']['p95_ms'] if level['initial_payload'] else float('nan'):>9.1f} ms  "
+                  f"播放器广播 p95 {fan_out['p95_ms'] if fan_out else float('nan'):>8.1f} ms  "
+                  f"{level['rss_per_connection_kb']:>7.1f} KB/连接  "
+                  f"新增 {level['library_burst']['songs']} 首 → {level['library_burst']['messages_per_client']} 条更新/客户端")
+            if level["connected"] - level["dropped"] < clients * (1 - args.max_failures):
+                print(f"失败比例超过 {args.max_failures:.0%}，停止加压。")
+                results["breaking_point"] = clients
+                break
+        return results
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="100,500,1000,2000", help="逐级增加的客户端数量")
+    parser.add_argument("--songs", type=int, default=10000, help="服务器音乐库规模 (决定首屏 payload 大小)")
+    parser.add_argument("--broadcasts", type=int, default=5, help="每类广播的次数")
+    parser.add_argument("--burst", type=int, default=20, help="连续新增的歌曲数 (检查合并广播)")
+    parser.add_argument("--transports", default="websocket", help="websocket 或 polling,websocket")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-failures", type=float, default=0.05, help="失败比例超过该值时停止加压")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--data-dir", default=str(ROOT / "benchmarks" / ".data"))
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.songs, args.data_dir)
+        return
+
+    raise_fd_limit()
+    results = asyncio.run(run(args))
+    if args.output:
+        write_results(args.output, "socketio", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_startup.py
+"""
+启动基准：多次以子进程运行 `python app.py`，测量从启动进程到第一次成功响应 GET / 的时间，
+并读取 /metrics 中 startup_phase_seconds 记录的各阶段耗时 (imports / web_ready / index_loaded ...)。
+未配置 DISCORD_BOT_TOKEN 时 bot 登录失败，不影响 web 服务的测量。
+
+用法：
+    python benchmarks/bench_startup.py [--runs 5] [--music-dir 路径] [--output result.json]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from common import ROOT, summarize, write_results, compare
+
+PHASE_PATTERN = re.compile(r'^startup_phase_seconds\{phase="([^"]+)"\} ([0-9.e+-]+)$', re.MULTILINE)
+
+
+def fetch(url: str, timeout: float = 1.0) -> str:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode("utf-8", "replace")
+
+
+def run_once(port: int, env: dict, timeout: float, settle: float) -> dict:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=str(ROOT), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_response = None
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"app.py 提前退出 (返回码 {process.returncode})")
+            try:
+                fetch(f"http://127.0.0.1:{port}/")
+                first_response = time.perf_counter() - start
+                break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.02)
+        if first_response is None:
+            raise TimeoutError("等待首个响应超时")
+
+        # 等待后台索引加载等阶段完成后再读取阶段耗时
+        time.sleep(settle)
+        phases = {name: float(value) for name, value in PHASE_PATTERN.findall(fetch(f"http://127.0.0.1:{port}/metrics"))}
+        return {"first_response": first_response, "phases": phases}
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5000, help="app.py 监听的端口 (通过 PORT 环境变量传入)")
+    parser.add_argument("--music-dir", help="覆盖 MUSIC_DIR (例如指向 bench_library 生成的目录)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--settle", type=float, default=3, help="首个响应后等待多久再读取阶段耗时")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    args = parser.parse_args()
+
+    # 端口和持久化文件都由环境变量指定：下载任务库和播放状态日志放在临时目录，
+    # 既不读取本机上次的状态 (恢复下载/播放会改变启动耗时)，也不改动它
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ, PORT=str(args.port),
+               DOWNLOAD_DB=os.path.join(workdir, "downloads.db"),
+               PLAYER_STATE_JOURNAL=os.path.join(workdir, "player_state.jsonl"))
+    if args.music_dir:
+        env["MUSIC_DIR"] = args.music_dir
+
+    try:
+        runs = [run_once(args.port, env, args.timeout, args.settle) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results = {"first_response": summarize([run["first_response"] for run in runs]), "phases": {}}
+    for phase in sorted({phase for run in runs for phase in run["phases"]}):
+        results["phases"][phase] = summarize([run["phases"][phase] for run in runs if phase in run["phases"]])
+
+    print(f"首个响应: median {results['first_response']['median_ms']:.0f} ms")
+    for phase, stats in results["phases"].items():
+        print(f"  {phase:<16} median {stats['median_ms']:>8.0f} ms")
+
+    if args.output:
+        write_results(args.output, "startup", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/check_imports.py
+"""
+导入冒烟检查：在独立子进程中逐个导入项目根目录下的模块 (包括 app.py、dc_command.py 等入口)，
+任何一个导入失败都以非零状态退出。导入不会启动 bot 或 web 服务，无需 DISCORD_BOT_TOKEN。
+修改入口模块或模块间的事件订阅后先运行本检查，再运行其他基准。
+
+用法：
+    python benchmarks/check_imports.py [模块名 ...]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 导入时会交互式读取输入的脚本
+SKIP = {"env_fill"}
+# 入口脚本按 `python app.py` 的方式加载 (作为独立模块执行，但不进入 __main__ 分支)，
+# 与其他模块互相导入时的行为和实际运行一致
+ENTRY_SCRIPTS = {"app"}
+
+
+def check(module: str, timeout: float) -> tuple[bool, float, str]:
+    if module in ENTRY_SCRIPTS:
+        code = f"import runpy; runpy.run_path({module + '.py'!r}, run_name='__smoke__')"
+    else:
+        code = f"import {module}"
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, "-c", code], cwd=str(ROOT),
+                                capture_output=True, text=True, timeout=timeout, stdin=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        return False, time.perf_counter() - start, f"导入超过 {timeout:.0f} 秒"
+    elapsed = time.perf_counter() - start
+    lines = result.stderr.strip().splitlines()
+    return result.returncode == 0, elapsed, lines[-1] if lines else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", help="要检查的模块 (默认：根目录下所有 .py 模块)")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    modules = args.modules or sorted(path.stem for path in ROOT.glob("*.py") if path.stem not in SKIP)
+    failed = []
+    for module in modules:
+        ok, elapsed, message = check(module, args.timeout)
+        print(f"  {'OK ' if ok else 'ERR'} {module:<16}{elapsed * 1000:>8.0f} ms  {'' if ok else message}")
+        if not ok:
+            failed.append(module)
+
+    if failed:
+        print(f"导入失败：{', '.join(failed)}")
+        sys.exit(1)
+    print(f"{len(modules)} 个模块全部导入成功")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/common.py
+"""基准测试共用的计时、结果保存和对比工具。"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def make_tone(path: Path, seconds: float, frequency: int = 440):
+    """用 ffmpeg 生成测试音频 (与下载器输出相同的 320k mp3)"""
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency={frequency}:duration={seconds}",
+        "-ac", "2", "-ar", "48000", "-c:a", "libmp3lame", "-b:a", "320k", str(path),
+    ], check=True)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """把一组耗时 (秒) 汇总为毫秒统计"""
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "median_ms": round(statistics.median(ordered) * 1000, 4),
+        "p95_ms": round(pct(0.95) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None) -> Dict[str, float]:
+    """重复执行 func 并汇总耗时；setup 在每次执行前调用，不计入耗时"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def git_revision() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def write_results(path: str, suite: str, results: Dict):
+    """保存结果 (附带提交号和运行环境，便于跨提交比较)"""
+    document = {
+        "suite": suite,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(document, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"结果已保存到 {path}")
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline_path: str, results: Dict, key_suffix: str = "median_ms", threshold: float = 0.1):
+    """与之前保存的结果比较，打印变化超过 threshold 的指标"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    old = _flatten(baseline["results"])
+    new = _flatten(results)
+    print(f"\n与 {baseline.get('revision', '?')} 比较 ({key_suffix}):")
+    for name, value in new.items():
+        if not name.endswith(key_suffix) or name not in old or not old[name]:
+            continue
+        change = (value - old[name]) / old[name]
+        marker = "慢" if change > threshold else "快" if change < -threshold else " "
+        print(f"  {marker} {name:<60}{old[name]:>12.3f}{value:>12.3f}{change:>+9.1%}")
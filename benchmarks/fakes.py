@@ -0,0 +1,220 @@
+# benchmarks/fakes.py
+"""
+离线基准用的 Discord 替身：不连接 Discord，在进程内模拟 VoiceClient 的发送线程，
+以及斜杠命令使用的 Interaction (response / followup)、服务器和语音频道。
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+FRAME_INTERVAL = 0.02  # discord.py 每 20ms 发送一帧
+
+
+def load_encoder():
+    """尝试创建 Opus 编码器 (与真实发送一样计入编码 CPU)，libopus 不可用时返回 None"""
+    try:
+        if not discord.opus.is_loaded():
+            discord.opus._load_default()
+        return discord.opus.Encoder()
+    except Exception as e:
+        print(f"WARNING: libopus 不可用，基准不包含 Opus 编码开销: {e}")
+        return None
+
+
+class FakeVoiceClient:
+    """
+    模拟 discord.VoiceClient 的播放接口 (play / stop / pause / resume / is_playing)。
+    发送线程按 discord.py AudioPlayer 的节拍读取音频源，并记录每次播放的帧时间。
+    """
+
+    def __init__(self, loop, guild_id: int = 0, encoder=None):
+        self.loop = loop
+        self.guild = SimpleNamespace(id=guild_id, name=f"bench-{guild_id}")
+        self.channel = SimpleNamespace(id=guild_id, name=f"bench-voice-{guild_id}")
+        self.encoder = encoder
+        self.source = None
+        # 每次 play() 一条记录
+        self.streams: List[Dict] = []
+        self._end: Optional[threading.Event] = None
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self._end is not None and not self._end.is_set() and self._resumed.is_set()
+
+    def is_paused(self) -> bool:
+        return self._end is not None and not self._end.is_set() and not self._resumed.is_set()
+
+    def play(self, source, *, after: Optional[Callable] = None):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        stream = {
+            "play_called": time.perf_counter(),
+            "first_frame": None,
+            "last_frame": None,
+            "frames": 0,
+            "late": [],
+            "done": threading.Event(),
+        }
+        self.streams.append(stream)
+        self.source = source
+        self._end = threading.Event()
+        self._resumed.set()
+        threading.Thread(target=self._send_loop, args=(source, after, self._end, stream), daemon=True).start()
+
+    def stop(self):
+        if self._end is not None:
+            self._end.set()
+            self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+
+    def _send_loop(self, source, after, end: threading.Event, stream: Dict):
+        """与 discord.py AudioPlayer._do_run 相同的节拍：start + 20ms × 帧序号"""
+        error = None
+        loops = 0
+        start = time.perf_counter()
+        try:
+            while not end.is_set():
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    loops = 0
+                    start = time.perf_counter()
+                    continue
+
+                loops += 1
+                data = source.read()
+                if not data:
+                    break
+                now = time.perf_counter()
+                if stream["first_frame"] is None:
+                    stream["first_frame"] = now
+                stream["last_frame"] = now
+                stream["frames"] += 1
+                if self.encoder is not None:
+                    self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+
+                next_time = start + FRAME_INTERVAL * loops
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    stream["late"].append(-delay)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            stream["done"].set()
+            if after is not None:
+                try:
+                    after(error)
+                except Exception as e:
+                    print(f"ERROR: after 回调失败: {e}")
+
+
+class FakeMessage:
+    """followup.send(wait=True) 返回的消息"""
+
+    def __init__(self, interaction: "FakeInteraction", content: str):
+        self.interaction = interaction
+        self.content = content
+
+    async def edit(self, content: str = None, **kwargs):
+        self.content = content
+        self.interaction.record("edit")
+
+
+class FakeResponse:
+    """interaction.response：第一次回应 (defer 或 send_message)"""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False):
+        self._respond("defer")
+
+    async def send_message(self, content: str = None, *, ephemeral: bool = False, **kwargs):
+        self._respond("send_message", content)
+
+    def _respond(self, kind: str, content: str = None):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        self.interaction.record(kind, content)
+
+
+class FakeFollowup:
+    """interaction.followup"""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, content: str = None, *, ephemeral: bool = False, wait: bool = False, **kwargs):
+        self.interaction.record("followup", content)
+        return FakeMessage(self.interaction, content)
+
+
+class FakeVoiceChannel:
+    """语音频道：connect() 返回 FakeVoiceClient"""
+
+    def __init__(self, guild: "FakeGuild", channel_id: int = 1, encoder=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = f"bench-voice-{channel_id}"
+        self.encoder = encoder
+
+    async def connect(self, **kwargs) -> FakeVoiceClient:
+        client = FakeVoiceClient(asyncio.get_running_loop(), guild_id=self.guild.id, encoder=self.encoder)
+        client.channel = self
+        client.guild = self.guild
+        self.guild.voice_client = client
+        return client
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+        self.name = f"bench-{guild_id}"
+        self.voice_client: Optional[FakeVoiceClient] = None
+
+
+class FakeInteraction:
+    """
+    可注入的 discord.Interaction 替身：记录从创建到每次回应 (defer / send_message / followup / edit) 的耗时。
+    """
+
+    def __init__(self, guild: FakeGuild, channel: Optional[FakeVoiceChannel] = None, user_id: int = 1):
+        self.created = time.perf_counter()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = SimpleNamespace(id=user_id, name=f"bench-user-{user_id}",
+                                    voice=SimpleNamespace(channel=channel) if channel else None)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.timeline: List[tuple] = []
+
+    def record(self, kind: str, content: str = None):
+        self.timeline.append((kind, time.perf_counter() - self.created, content))
+
+    def first(self, *kinds: str) -> Optional[float]:
+        """某类回应第一次出现的耗时 (秒)"""
+        return next((elapsed for kind, elapsed, _ in self.timeline if kind in kinds), None)
@@ -0,0 +1,52 @@
+# broadcast.py
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class Broadcaster:
+    """
+    Socket.IO 广播调度器：所有推送按房间发送，并合并短时间内同一 key 的重复更新。
+    payload 在真正发送时才构建一次，每次广播只 emit 一次 (由 python-socketio 对房间统一编码)。
+    """
+
+    def __init__(self, server, event: str = "update_status"):
+        self.server = server
+        self.event = event
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, Tuple[str, Callable[[], Any]]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """绑定主事件循环 (在 main() 中调用)"""
+        self._loop = loop
+
+    def schedule(self, key: str, room: str, build: Callable[[], Any], delay: float = 0.0):
+        """
+        安排一次广播，可在任意线程中调用。
+        同一 key 在发送前的多次调用只保留最后一个 build；build 返回 None 表示无需发送。
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        with self._lock:
+            first = key not in self._pending
+            self._pending[key] = (room, build)
+        if first:
+            loop.call_soon_threadsafe(loop.call_later, delay, self._flush, key)
+
+    def _flush(self, key: str):
+        """在事件循环中构建 payload 并广播给房间"""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if not entry:
+            return
+        room, build = entry
+        try:
+            payload = build()
+        except Exception as e:
+            print(f"ERROR: 构建广播 {key} 失败: {e}")
+            return
+        if payload is not None:
+            self._loop.create_task(self.server.emit(self.event, payload, room=room))
@@ -3,18 +3,25 @@ from discord import app_commands, Interaction
 import asyncio
 import re  # 引入re模块用于URL和时间解析
 from tools import download_status, get_music, music_dir, get_path, verify_name, get_music_duration, get_name, \
-    get_player, check_music_open, edit_play_queue, Path
-from dc_config import tree, music_choice, messages, music_player
-from dc_extra import autocomplete_music_callback, ensure_voice, play_track
-from downloader import download_task
+    get_player, check_music_open, edit_play_queue, get_library, find_music, run_blocking, single_flight, \
+    warm_duration, Path
+from dc_config import tree, music_choice, messages, music_player, bot
+from dc_extra import autocomplete_music_callback, ensure_voice, play_track, leave_voice, pause_playback, resume_playback
+from downloader import add_task, get_job, resolve_stream, extract_url as extract_video_url
 from uuid import uuid4
 from typing import Optional, List, Callable, Awaitable
 import shutil
 import os
-# 【重要】导入 app 模块中的 SocketIO 相关函数，用于通知 Web 界面更新
-import app
 import random
-from app import socketio, get_music_data, connected_sids
+from events import subscribe, publish
+from profiling import profiled
+from diagnostics import snapshot, diagnose
+import time
+
+# /download 发出的消息，按任务 ID 记录，用于推送进度 (设置 DOWNLOAD_EDIT_MESSAGES=0 可关闭)
+DOWNLOAD_EDIT_MESSAGES = os.getenv("DOWNLOAD_EDIT_MESSAGES", "1") != "0"
+DOWNLOAD_EDIT_INTERVAL = 3.0  # 两次编辑之间的最小间隔 (秒)，避免触发 Discord 速率限制
+download_messages = {}
 
 
 # =========================================================================
@@ -70,6 +77,7 @@ def time_to_seconds(time_str: str) -> int:
 # =========================================================================
 
 @tree.command(name="refresh", description="手动刷新音乐文件索引 (用于 Web 界面和命令补全)")
+@profiled("refresh")
 async def refresh_music_index(interaction: Interaction):
     """手动刷新音乐索引"""
     # 延迟响应，让用户知道操作正在进行
@@ -77,13 +85,9 @@ async def refresh_music_index(interaction: Interaction):
 
     try:
         # 调用 get_music() 并传入 "force_rescan" 参数，强制重新扫描文件并更新全局索引
-        get_music(check="force_rescan")
-
-        # 通知 Web 客户端更新列表 (避免循环依赖，通过 app 模块访问)
-        if app.socketio:
-            music_data = app.get_music_data()
-            for sid in list(app.connected_sids):
-                app.socketio.emit("update_status", music_data, to=sid)
+        # 扫描完成后发布 library_changed 事件，由 app 模块通知 Web 客户端 (避免循环依赖)
+        # 扫描在线程池中执行，多人同时刷新时共享同一次扫描
+        await single_flight("rescan", get_music, "force_rescan")
 
         await interaction.followup.send("✅ 音乐文件索引已成功刷新！Web 界面和命令选项已更新。", ephemeral=True)
         print("DEBUG: Music index manually refreshed.")
@@ -98,10 +102,14 @@ async def refresh_music_index(interaction: Interaction):
 # =========================================================================
 
 @tree.command(name="status", description="查看当前播放状态、音量和队列信息")
+@profiled("status")
 async def status_command(interaction: Interaction):
     """查看当前播放状态，美化显示"""
     await interaction.response.defer(ephemeral=False)
 
+    # get_player 只读取缓存的时长，未缓存时先在线程池中读取
+    if music_player.play_queue:
+        await warm_duration(music_player.play_queue[music_player.current_track_index])
     player_data = get_player()
 
     current_path_str = player_data.get("current_path")
@@ -117,7 +125,8 @@ async def status_command(interaction: Interaction):
     response_lines = [
         f"🎧 **播放器状态**",
         f"🎶 **当前状态:** `{player_data.get('status', '空闲')}`",
-        f"🔊 **音量:** `{player_data.get('current_volume', '60%') * 100:.0f}%`",
+        # get_player 返回的音量已格式化为百分比字符串 (例如 "60%")
+        f"🔊 **音量:** `{player_data.get('current_volume', '60%')}`",
         f"🔄 **循环模式:** `{playback_mode_text}`",
         "---"
     ]
@@ -146,19 +155,35 @@ async def status_command(interaction: Interaction):
     await interaction.followup.send("\n".join(response_lines))
 
 
+@tree.command(name="debug_audio", description="查看最近的语音帧延迟和事件循环阻塞情况 (排查卡顿)")
+@profiled("debug_audio")
+async def debug_audio_command(interaction: Interaction):
+    """卡顿诊断：汇总最近的音频帧读取和事件循环延迟"""
+    stats = snapshot()
+    frames, loop = stats["frames"], stats["loop"]
+    response_lines = [
+        f"🩺 **播放诊断** (最近 `{frames['window_seconds']}` 秒, `{frames['count']}` 帧)",
+        f"📥 **帧读取:** p50 `{frames['read_p50_ms']} ms` / p99 `{frames['read_p99_ms']} ms` / 最大 `{frames['read_max_ms']} ms`",
+        f"⏰ **延迟帧:** `{frames['late_frames']}`  🐢 **读取超时:** `{frames['slow_reads']}`  🕳️ **空读:** `{frames['empty_reads']}`",
+        f"🚦 **启动:** 首帧前读取 `{frames['startup_reads']}` 次 / 最长 `{frames['startup_max_ms']} ms` / 启动慢 `{frames['slow_starts']}`",
+        f"🔁 **事件循环延迟:** p50 `{loop['lag_p50_ms']} ms` / p99 `{loop['lag_p99_ms']} ms` / 最大 `{loop['lag_max_ms']} ms`",
+        f"💡 {diagnose(stats)}",
+    ]
+    await interaction.response.send_message("\n".join(response_lines), ephemeral=True)
+
+
 # =========================================================================
 # === 其他命令保持不变 ===
 # =========================================================================
 
 @tree.command(name="leave", description="离开语音频道")
+@profiled("leave")
 async def leave(interaction: Interaction):
     try:
         vc = interaction.guild.voice_client
         if vc is not None and vc.is_connected():
-            # 优化：添加停止播放确保连接关闭干净
-            if vc.is_playing():
-                vc.stop()
-            await vc.disconnect()
+            # 停止播放 (不触发自动切歌) 并断开
+            await leave_voice(vc)
             await interaction.response.send_message(f"已离开语音频道。", ephemeral=True)
         else:
             await interaction.response.send_message("当前没有连接到任何语音频道。", ephemeral=True)
@@ -169,6 +194,7 @@ async def leave(interaction: Interaction):
 @tree.command(name="download", description="下载视频为 mp3 可选播放列表")
 @app_commands.describe(url="YouTube 或 Bilibili 视频链接", playlist="播放列表")
 @app_commands.autocomplete(playlist=autocomplete_music_callback(include_music=False, include_playlist_music=False))
+@profiled("download")
 async def download_command(interaction: Interaction, url: str, playlist: Optional[str] = None):
     # 保持不变
     await interaction.response.defer(thinking=True, ephemeral=True)
@@ -189,52 +215,123 @@ async def download_command(interaction: Interaction, url: str, playlist: Optiona
         folder_path = get_path(music_dir, playlist, "%(title)s.%(ext)s") if playlist else get_path(music_dir,
                                                                                                  filename="%(title)s.%(ext)s")
 
-        download_task.put({"id": task_id, "url": valid_url, "folder": folder_path})
+        add_task(task_id, valid_url, folder_path)
 
-        await interaction.followup.send(f"✅ 下载任务已添加！任务ID: `{task_id}`，请使用 `/download_status` 命令查看进度。",
-                                        ephemeral=False)
+        message = await interaction.followup.send(
+            f"✅ 下载任务已添加！任务ID: `{task_id}`，请使用 `/download_status` 命令查看进度。",
+            ephemeral=False, wait=True)
+        if DOWNLOAD_EDIT_MESSAGES:
+            # 之后的进度直接编辑这条消息推送
+            download_messages[task_id] = {"message": message, "last_edit": 0.0}
 
     except Exception as e:
         await interaction.followup.send(f"❌ 添加下载任务失败: {e}", ephemeral=True)
 
 
+def format_download_status(task_id: str, status: dict) -> str:
+    """把下载进度格式化为 Discord 消息文本"""
+    message = f"下载任务ID: `{task_id}`\n"
+    if status.get("status") == "downloading":
+        message += f"▶️ **状态:** 下载中\n"
+        message += f"📦 **进度:** `{status.get('progress', '0.0%')}`\n"
+        message += f"⏳ **预计剩余时间:** `{status.get('eta', '未知')}`\n"
+    elif status.get("status") == "finished":
+        message += f"✅ **状态:** 下载完成\n"
+        message += f"📁 **文件:** `{status.get('filename')}`"
+    elif status.get("status") == "queued":
+        message += f"🕒 **状态:** 排队中\n"
+    elif status.get("status") == "error":
+        message += f"❌ **状态:** 失败\n"
+        message += f"⚠️ **原因:** `{status.get('message', '未知错误')}`"
+    return message
+
+
+@subscribe("download_progress")
+def edit_download_message(status: dict):
+    """下载进度变化时编辑 /download 发出的消息 (在下载线程中调用)"""
+    task_id = status.get("id")
+    entry = download_messages.get(task_id)
+    if not entry:
+        return
+
+    finished = status.get("status") in ("finished", "error")
+    now = time.monotonic()
+    if not finished and now - entry["last_edit"] < DOWNLOAD_EDIT_INTERVAL:
+        return
+    entry["last_edit"] = now
+    if finished:
+        download_messages.pop(task_id, None)
+
+    async def edit():
+        try:
+            await entry["message"].edit(content=format_download_status(task_id, status))
+        except Exception as e:
+            # 交互令牌 15 分钟后失效，之后无法再编辑
+            download_messages.pop(task_id, None)
+            print(f"DEBUG: 无法编辑下载进度消息 {task_id}: {e}")
+
+    asyncio.run_coroutine_threadsafe(edit(), bot.loop)
+
+
 @tree.command(name="download_status", description="查询下载进度")
 @app_commands.describe(task_id="下载任务ID")
+@profiled("download_status")
 async def download_status_command(interaction: Interaction, task_id: str):
     # 保持不变
     await interaction.response.defer(thinking=True, ephemeral=False)
 
     status = download_status(query_id=task_id)
+    if not status:
+        # 进度记录已过期时，回退到持久化的任务库
+        status = await run_blocking(get_job, task_id)
 
     if not status:
         await interaction.followup.send(f"❌ 未找到 ID 为 `{task_id}` 的下载任务或任务已完成。", ephemeral=True)
         return
 
-    message = f"下载任务ID: `{task_id}`\n"
-    if status.get("status") == "downloading":
-        message += f"▶️ **状态:** 下载中\n"
-        message += f"📦 **进度:** `{status.get('progress', '0.0%')}`\n"
-        message += f"⏳ **预计剩余时间:** `{status.get('eta', '未知')}`\n"
-    elif status.get("status") == "finished":
-        # 下载完成，强制刷新索引并通知 Web 客户端
-        get_music(check="force_rescan")
-        if app.socketio:
-            music_data = app.get_music_data()
-            # 广播给所有连接的客户端
-            app.socketio.emit("update_status", music_data) 
+    # 下载完成的文件已由后处理阶段插入索引，这里无需再刷新
+    message = format_download_status(task_id, status)
+    await interaction.followup.send(message)
 
-        message += f"✅ **状态:** 下载完成\n"
-        message += f"📁 **文件:** `{status.get('filename')}`"
-    elif status.get("status") == "error":
-        message += f"❌ **状态:** 失败\n"
-        message += f"⚠️ **原因:** `{status.get('message', '未知错误')}`"
 
-    await interaction.followup.send(message)
+async def play_stream(interaction: Interaction, vc, url: str, seek_seconds: int = 0):
+    """边下边播：直接串流视频音频，播放完成后自动保存到音乐库"""
+    try:
+        # yt-dlp 解析在有界线程池中执行；同一链接的并发 /play 共享一次解析
+        stream = await single_flight(("stream", url), resolve_stream, url)
+    except Exception as e:
+        stream = None
+        print(f"ERROR: 解析串流失败: {e}")
+    if not stream:
+        await interaction.followup.send("❌ 无法解析该链接的音频流。", ephemeral=True)
+        return
+
+    # 与下载器相同：保存为根目录单曲，文件名不能包含路径分隔符
+    safe_title = verify_name(stream["title"]).replace("/", "_").replace("\\", "_") or uuid4().hex
+    final_path = get_path(music_dir, filename=f"{safe_title}.mp3")
+
+    music_player.play_queue = [final_path]
+    music_player.current_track_index = 0
+    music_player.playback_mode = "no_loop"
+
+    # 只有确实打断了正在播放的曲目时才标记，否则没有回调消费该标记，会吞掉下一次自然结束
+    skipped = vc.is_playing() or vc.is_paused()
+    if final_path.exists():
+        # 已在音乐库中，直接播放本地文件
+        play_track(vc, final_path, seek_seconds)
+    else:
+        os.makedirs(music_dir, exist_ok=True)
+        play_track(vc, final_path, seek_seconds, stream=stream)
+    if skipped:
+        music_player.manual_skip = True
+
+    await interaction.followup.send(f"✅ {messages['play']['stream']}：**{stream['title']}**", ephemeral=False)
 
 
 @tree.command(name="play", description="播放音乐")
-@app_commands.describe(name="歌曲或播放列表名称", seek_time="跳转时间 (例如 1:30 或 90)")
+@app_commands.describe(name="歌曲、播放列表名称或视频链接", seek_time="跳转时间 (例如 1:30 或 90)")
 @app_commands.autocomplete(name=autocomplete_music_callback(include_music=True, include_playlist_music=True))
+@profiled("play")
 async def play_command(interaction: Interaction, name: str, seek_time: Optional[str] = None):
     # 保持不变
     await interaction.response.defer(thinking=True)
@@ -245,38 +342,23 @@ async def play_command(interaction: Interaction, name: str, seek_time: Optional[
             # ensure_voice 已经发送了错误消息
             return
 
-        music_data = get_music()
-        if not music_data:
+        # 0. 视频链接：边下边播
+        if extract_video_url(name):
+            seek_seconds = time_to_seconds(seek_time) if seek_time else 0
+            await play_stream(interaction, vc, name, seek_seconds)
+            return
+
+        library = get_library()
+        if not library.items:
+            # 索引还在后台加载 (或确实为空)：在线程池中等待/执行扫描，不阻塞事件循环
+            await run_blocking(get_music)
+            library = get_library()
+        if not library.items:
             await interaction.followup.send("❌ 音乐库为空，请先下载音乐。", ephemeral=True)
             return
 
         # 1. 查找匹配的歌曲或列表
-        found_item = None
-        is_playlist_song = "/" in name
-
-        if is_playlist_song:
-            # 尝试匹配播放列表中的单曲
-            playlist_name, song_name_stem = name.rsplit("/", 1)
-            for item in music_data:
-                if item["type"] == "playlist" and item["name"] == playlist_name:
-                    if song_name_stem in item["music"]:
-                        # 找到歌曲在列表中的索引
-                        song_index = item["music"].index(song_name_stem)
-                        # 构造 FoundItem 以便后续处理
-                        found_item = {
-                            "type": "playlist_song",
-                            "name": song_name_stem,
-                            "path": item["paths"][song_index],
-                            "playlist_name": playlist_name
-                        }
-                        break
-
-        if not found_item:
-            # 尝试匹配根目录单曲或播放列表
-            for item in music_data:
-                if item["name"] == name:
-                    found_item = item
-                    break
+        found_item = find_music(name, library)
 
         if not found_item:
             await interaction.followup.send(f"❌ 未找到歌曲或播放列表：`{name}`", ephemeral=True)
@@ -295,8 +377,8 @@ async def play_command(interaction: Interaction, name: str, seek_time: Optional[
                 await interaction.followup.send(f"❌ 播放列表 `{name}` 为空。", ephemeral=True)
                 return
 
-            # 设置整个播放列表为队列
-            music_player.play_queue = paths
+            # 设置整个播放列表为队列 (复制：索引中的路径列表不可修改)
+            music_player.play_queue = list(paths)
 
             # 修改为：播放列表默认顺序播放模式启动 (播放完停止)
             music_player.playback_mode = "no_loop"
@@ -326,11 +408,12 @@ async def play_command(interaction: Interaction, name: str, seek_time: Optional[
         seek_seconds = 0
         if seek_time:
             seek_seconds = time_to_seconds(seek_time)
-            if seek_seconds > 0:
-                music_player.manual_skip = True
 
-        # 4. 播放
+        # 4. 播放 (与 /next 相同：只有打断了正在播放的曲目时才标记手动跳过)
+        skipped = vc.is_playing() or vc.is_paused()
         play_track(vc, initial_path, int(seek_seconds))
+        if skipped:
+            music_player.manual_skip = True
 
     except Exception as e:
         error_msg = f"❌ 播放时发生错误: {e}"
@@ -342,6 +425,7 @@ async def play_command(interaction: Interaction, name: str, seek_time: Optional[
 
 
 @tree.command(name="next", description="播放下一首音乐")
+@profiled("next")
 async def next_command(interaction: Interaction):
     # 保持不变
     await interaction.response.defer(thinking=True, ephemeral=True)
@@ -374,19 +458,25 @@ async def next_command(interaction: Interaction):
         # 停止播放，但不清空队列
         if vc.is_playing() or vc.is_paused():
             vc.stop()
+        music_player.released = None
         music_player.current_track_index = queue_len - 1
+        publish("player_changed")
         return
 
     music_player.current_track_index = next_index
     next_path = music_player.play_queue[next_index]
+    # 暂停过久已释放解码进程时，没有被停止的音频源，也就没有需要跳过的回调
+    skipped = vc.is_playing() or vc.is_paused()
     play_track(vc, next_path)
-    music_player.manual_skip = True  # 标记为手动跳过
+    if skipped:
+        music_player.manual_skip = True  # 标记为手动跳过
 
     await interaction.followup.send(f"✅ {messages['next_previous']['next'][1]}：**{Path(next_path).stem}**",
                                    ephemeral=True)
 
 
 @tree.command(name="previous", description="播放上一首音乐")
+@profiled("previous")
 async def previous_command(interaction: Interaction):
     # 保持不变
     await interaction.response.defer(thinking=True, ephemeral=True)
@@ -419,19 +509,25 @@ async def previous_command(interaction: Interaction):
             # 停止播放，但不清空队列
             if vc.is_playing() or vc.is_paused():
                 vc.stop()
+            music_player.released = None
             music_player.current_track_index = 0
+            publish("player_changed")
             return
 
     music_player.current_track_index = previous_index
     previous_path = music_player.play_queue[previous_index]
+    # 暂停过久已释放解码进程时，没有被停止的音频源，也就没有需要跳过的回调
+    skipped = vc.is_playing() or vc.is_paused()
     play_track(vc, previous_path)
-    music_player.manual_skip = True  # 标记为手动跳过
+    if skipped:
+        music_player.manual_skip = True  # 标记为手动跳过
 
     await interaction.followup.send(f"✅ {messages['next_previous']['previous'][1]}：**{Path(previous_path).stem}**",
                                    ephemeral=True)
 
 
 @tree.command(name="pause", description="暂停或恢复播放")
+@profiled("pause")
 async def pause_command(interaction: Interaction):
     # 保持不变
     await interaction.response.defer(ephemeral=True)
@@ -442,10 +538,9 @@ async def pause_command(interaction: Interaction):
         return
 
     if vc.is_playing():
-        vc.pause()
+        pause_playback(vc)
         await interaction.followup.send(messages['pause_resume']['pause'], ephemeral=True)
-    elif vc.is_paused():
-        vc.resume()
+    elif resume_playback(vc):
         await interaction.followup.send(messages['pause_resume']['resume'], ephemeral=True)
     else:
         await interaction.followup.send("❌ 当前没有音乐在播放或暂停。", ephemeral=True)
@@ -453,6 +548,7 @@ async def pause_command(interaction: Interaction):
 
 @tree.command(name="volume", description="设置播放音量 (0-100)")
 @app_commands.describe(volume="音量百分比 (0-100)")
+@profiled("volume")
 async def volume_command(interaction: Interaction, volume: int):
     # 保持不变
     await interaction.response.defer(ephemeral=True)
@@ -467,6 +563,7 @@ async def volume_command(interaction: Interaction, volume: int):
     if vc and vc.is_playing() and vc.source:
         # discord.py的FFmpegOpusAudio source有一个volume属性
         vc.source.volume = music_player.current_volume
+    publish("player_changed")
 
     await interaction.followup.send(f"🔊 音量已设置为 `{volume}%`。", ephemeral=True)
 
@@ -474,12 +571,14 @@ async def volume_command(interaction: Interaction, volume: int):
 @tree.command(name="mode", description="设置播放模式")
 @app_commands.describe(mode="播放模式")
 @app_commands.choices(mode=music_choice)
+@profiled("mode")
 async def mode_command(interaction: Interaction, mode: app_commands.Choice[str]):
     # 保持不变
     await interaction.response.defer(ephemeral=True)
 
     mode_value = mode.value
     music_player.playback_mode = mode_value
+    publish("player_changed")
     mode_text = messages['playback_mode'].get(mode_value, '未知模式')
 
     await interaction.followup.send(f"🔄 播放模式已设置为 **{mode_text}**。", ephemeral=True)
@@ -487,6 +586,7 @@ async def mode_command(interaction: Interaction, mode: app_commands.Choice[str])
 
 @tree.command(name="seek", description="跳转到歌曲指定时间")
 @app_commands.describe(seek_time="跳转时间 (例如 1:30 或 90)")
+@profiled("seek")
 async def seek_command(interaction: Interaction, seek_time: str):
     # 保持不变
     await interaction.response.defer(ephemeral=True)
@@ -506,7 +606,7 @@ async def seek_command(interaction: Interaction, seek_time: str):
             return
 
         path = music_player.play_queue[music_player.current_track_index]
-        duration_sec, _, _ = get_music_duration(path)
+        duration_sec, _, _ = await single_flight(("duration", str(path)), get_music_duration, path)
 
         seconds = 0
         try:
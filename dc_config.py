@@ -1,10 +1,8 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from dotenv import load_dotenv
 import os
 
-load_dotenv()
 token = os.getenv("DISCORD_BOT_TOKEN")
 
 intents = discord.Intents.all()
@@ -32,6 +30,21 @@ class MusicPlayer:
         self.current_volume = 0.60
         self.playback_mode = "loop_all"
         self.manual_skip = False
+        # 主动离开语音频道 (/leave、无人超时) 时置位，用于区分意外断线
+        self.disconnect_requested = False
+        # 上一次中断时的 (曲目路径, 播放位置)：续播后在同一位置再次中断时不再重试
+        self.interrupted_at = None
+        # 当前正在播放的音频源 (dc_extra.MonitoredVolumeTransformer)，用于计算播放位置
+        self.current_source = None
+        # 暂停过久、解码进程已释放时记录的 (曲目路径, 播放位置)，恢复时从该位置重新开始
+        self.released = None
+
+    def position(self) -> float:
+        """当前曲目的播放位置 (秒)"""
+        if self.released is not None:
+            return self.released[1]
+        source = self.current_source
+        return source.position if source is not None else 0.0
 
 
 music_player = MusicPlayer()
@@ -40,7 +53,8 @@ music_player = MusicPlayer()
 messages = {
     "play": {
         "mp3": "正在播放单曲",
-        "playlist": "正在加载播放列表"
+        "playlist": "正在加载播放列表",
+        "stream": "正在串流播放 (播放完成后自动保存到音乐库)"
     },
     "pause_resume": {
         "pause": "⏸️ 已暂停",
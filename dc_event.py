@@ -1,15 +1,30 @@
 from dc_config import tree, bot, voice_timeout_tasks, music_player
 from discord import Message, Member, VoiceState
 import asyncio
+from events import publish
+import startup
+import player_state
+from dc_extra import WARM_CHANNELS, leave_voice, warm_voice, notify_voice_connected
 
 @bot.event
 async def on_voice_state_update(member: Member, before: VoiceState, after: VoiceState):
-    """bot 所在语音频道无用户时，倒计时自动断开，断开连接时重置播放器"""
-    if member.bot and before.channel is not None and after.channel is None:
-        music_player.play_queue = []
-        music_player.current_track_index = 0
-        music_player.current_volume = 0.60
-        music_player.playback_mode = "no_loop"
+    """bot 所在语音频道无用户时，倒计时自动断开；主动断开时重置播放器，意外断开时保留队列"""
+    if member.id == bot.user.id and after.channel is not None:
+        # 连接 (或断线后重连) 成功：唤醒等待续播的任务
+        notify_voice_connected()
+    if member.id == bot.user.id and before.channel is not None and after.channel is None:
+        if music_player.disconnect_requested:
+            music_player.disconnect_requested = False
+            music_player.interrupted_at = None
+            music_player.play_queue = []
+            music_player.current_track_index = 0
+            music_player.current_volume = 0.60
+            music_player.playback_mode = "no_loop"
+        else:
+            print(f"WARNING: 语音连接意外断开 ({before.channel.name})，保留播放队列。")
+            if before.channel.id in WARM_CHANNELS:
+                asyncio.create_task(rejoin_warm_channel())
+        publish("player_changed")
 
     vc = member.guild.voice_client
     if not vc or not vc.channel:
@@ -23,7 +38,8 @@ async def on_voice_state_update(member: Member, before: VoiceState, after: Voice
         affected_channel_ids.add(before.channel.id)
     if after.channel:
         affected_channel_ids.add(after.channel.id)
-    if bot_channel_id not in affected_channel_ids:
+    if bot_channel_id not in affected_channel_ids or bot_channel_id in WARM_CHANNELS:
+        # 常驻频道无人时也保持连接
         return
 
     if all(user.bot for user in bot_channel.members):
@@ -34,7 +50,7 @@ async def on_voice_state_update(member: Member, before: VoiceState, after: Voice
             try:
                 await asyncio.sleep(300)  
                 if all(user.bot for user in bot_channel.members):
-                    await vc.disconnect()
+                    await leave_voice(vc)
             except asyncio.CancelledError:
                 pass
             finally:
@@ -53,8 +69,23 @@ async def on_message(message: Message):
     if message.author == bot.user:
         return  
 
+async def rejoin_warm_channel():
+    """常驻频道被意外断开后稍等片刻重新连接"""
+    await asyncio.sleep(5)
+    await warm_voice()
+
+
+async def restore_voice():
+    """先恢复上次的播放，再连接其余常驻频道 (依次执行，避免重复连接同一服务器)"""
+    await player_state.resume()
+    await warm_voice()
+
+
 @bot.event
 async def on_ready():
     """bot 启动后触发"""
+    # 恢复上次的播放、连接常驻频道 (不等待命令同步)
+    asyncio.create_task(restore_voice())
     await tree.sync()  
-    print(f"{bot.user} 成功启动！") 
\ No newline at end of file
+    print(f"{bot.user} 成功启动！") 
+    startup.mark("gateway_ready")
@@ -4,33 +4,49 @@ import asyncio
 from typing import Optional, List, Callable, Awaitable
 import random
 import platform
+import shlex
+import threading
+import time
 # 导入必要的配置和工具
 from dc_config import bot, music_player, messages
-from tools import get_music, Path
+from tools import get_library, warm_duration, Path
+from downloader import downloading
+from postprocess import finalize_stream
+from events import publish
+from diagnostics import record_frame
+from metrics import voice_frame_lateness, voice_late_frames, voice_underruns, ffmpeg_first_frame, \
+    player_queue_length
 import os
 
-# 🚀 关键修复：解决 discord.py 中 PCMVolumeTransformer 清理时缺失 'original' 属性的 Bug，并防止递归。
-try:
-    # 临时保存原始的 __init__ 方法
-    _original_init = discord.PCMVolumeTransformer.__init__
-
-
-    # 定义新的 __init__ 方法
-    def _new_init(self, original, volume=1.0):
-        # 显式地调用原始的 __init__ 方法，避免递归
-        _original_init(self, original, volume)
-
-        # 确保 original 属性存在
-        if not hasattr(self, 'original'):
-            self.original = original
 
+def apply_patches():
+    """
+    🚀 关键修复：解决 discord.py 中 PCMVolumeTransformer 清理时缺失 'original' 属性的 Bug，并防止递归。
+    由 app.main 在启动时调用一次 (重复调用不会重复打补丁)。
+    """
+    if getattr(discord.PCMVolumeTransformer.__init__, "_original_fix", False):
+        return
+    try:
+        # 临时保存原始的 __init__ 方法
+        _original_init = discord.PCMVolumeTransformer.__init__
+
+        # 定义新的 __init__ 方法
+        def _new_init(self, original, volume=1.0):
+            # 显式地调用原始的 __init__ 方法，避免递归
+            _original_init(self, original, volume)
+
+            # 确保 original 属性存在
+            if not hasattr(self, 'original'):
+                self.original = original
+
+        _new_init._original_fix = True
+        # 用新的方法替换类的方法
+        discord.PCMVolumeTransformer.__init__ = _new_init
+        print("DEBUG: Applied PCMVolumeTransformer 'original' attribute fix.")
+    except Exception as e:
+        # 如果补丁失败，打印警告，但不阻止程序运行
+        print(f"CRITICAL FIX ERROR: Failed to apply discord.py PCMVolumeTransformer patch: {e}")
 
-    # 用新的方法替换类的方法
-    discord.PCMVolumeTransformer.__init__ = _new_init
-    print("DEBUG: Applied PCMVolumeTransformer 'original' attribute fix.")
-except Exception as e:
-    # 如果补丁失败，打印警告，但不阻止程序运行
-    print(f"CRITICAL FIX ERROR: Failed to apply discord.py PCMVolumeTransformer patch: {e}")
 
 # --- FFMPEG Options ---
 FFMPEG_BEFORE_OPTIONS = '-re'
@@ -47,8 +63,108 @@ else:
     print(f"DEBUG: FFMPEG configured for {platform.system()} (Optimized + Buffered).")
 
 
+# 网络串流：断线自动重连
+FFMPEG_STREAM_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+# 边下边播时写入音乐库的编码参数 (与下载器的 mp3 320k 一致)
+FFMPEG_TEE_OPTIONS = '-vn -map 0:a -c:a libmp3lame -b:a 320k -f mp3'
+# FFmpegPCMAudio 把 PCM 输出格式放在 options 之前，有两个输出时会被第一个 (mp3) 输出占用，
+# 因此在 pipe:1 之前重新指定
+FFMPEG_PCM_OUTPUT_OPTIONS = '-f s16le -ar 48000 -ac 2'
+# 正在检查/转正的串流文件：完成前重复播放同一首时继续从网络播放
+_finalizing = set()
+_finalizing_lock = threading.Lock()
+
+
+def stream_input_options(stream: dict) -> str:
+    """构造串流输入参数：请求头和 (HTTP) 代理"""
+    options = FFMPEG_STREAM_BEFORE_OPTIONS
+    headers = "".join(f"{key}: {value}\r\n" for key, value in stream.get("headers", {}).items())
+    if headers:
+        options += f" -headers {shlex.quote(headers)}"
+    proxy_url = os.getenv("PROXY_URL")
+    if proxy_url:
+        if proxy_url.startswith("http"):
+            options += f" -http_proxy {shlex.quote(proxy_url)}"
+        else:
+            print("WARNING: FFmpeg 串流仅支持 HTTP 代理，将尝试直连。")
+    return options
+
+# --- 语音连接 ---
+CONNECT_KWARGS = {"reconnect": True, "timeout": 60, "self_deaf": True}
+# 常驻语音频道 (逗号分隔的频道 ID)：bot 就绪后提前连接并保持，首次 /play 无需等待建立语音连接
+WARM_CHANNELS = {int(c) for c in (os.getenv("VOICE_WARM_CHANNELS") or "").split(",") if c.strip()}
+# 语音断线后等待自动重连的最长时间 (秒)，重连后从断点继续播放当前曲目
+VOICE_RESUME_TIMEOUT = float(os.getenv("VOICE_RESUME_TIMEOUT") or 30)
+# 续播后在距上次中断位置不到该秒数处再次中断，视为没有进展 (文件本身有问题)，不再重试
+VOICE_RESUME_MIN_PROGRESS = 1.0
+# bot 自己的语音状态显示已连接时置位 (on_voice_state_update)，唤醒等待重连的续播任务
+_voice_connected = asyncio.Event()
+# 暂停超过该时间 (秒) 后结束 ffmpeg 进程释放解码资源，恢复时从暂停位置重新开始；0 表示不释放
+PAUSE_RELEASE_SECONDS = float(os.getenv("PAUSE_RELEASE_SECONDS") or 300)
+
 # ---------------------------------
 
+class MonitoredVolumeTransformer(discord.PCMVolumeTransformer):
+    """带音量控制的音频源，同时记录每帧相对 20ms 发送节拍的延迟"""
+
+    FRAME_INTERVAL = 0.02
+
+    def __init__(self, original, volume=1.0, spawned_at: Optional[float] = None, source_label: str = "file",
+                 start_offset: float = 0.0):
+        super().__init__(original, volume)
+        self._last_read = None
+        # 播放位置 = 起始跳转位置 + 已读取的帧数 × 20ms
+        self.start_offset = start_offset
+        self.frames = 0
+        # ffmpeg 进程的启动时间，读到第一帧后记录启动耗时
+        self._spawned_at = spawned_at
+        # 音频来源："file" (音乐库文件) 或 "stream" (边下边播)
+        self.label = source_label
+
+    def read(self) -> bytes:
+        now = time.perf_counter()
+        last, self._last_read = self._last_read, now
+        lateness = 0.0
+        # 间隔超过 1 秒视为暂停/恢复，不计入延迟
+        if last is not None and now - last < 1.0:
+            lateness = max(0.0, now - last - self.FRAME_INTERVAL)
+            if lateness > 0:
+                label = "1" if downloading.is_set() else "0"
+                voice_frame_lateness.labels(label).observe(lateness)
+                if lateness > self.FRAME_INTERVAL:
+                    voice_late_frames.labels(label).inc()
+
+        data = super().read()
+        read_time = time.perf_counter() - now
+        if data:
+            self.frames += 1
+        starting = self._spawned_at is not None
+        if starting:
+            if data:
+                ffmpeg_first_frame.labels(self.label).observe(time.perf_counter() - self._spawned_at)
+                self._spawned_at = None
+        elif read_time > self.FRAME_INTERVAL:
+            # ffmpeg 没能在一帧的时间内给出数据
+            voice_underruns.inc()
+        # 首帧之前的读取同样记录 (标记为启动阶段)，启动慢也能在诊断中看到
+        record_frame(read_time, lateness, not data, starting)
+        return data
+
+    @property
+    def position(self) -> float:
+        """当前播放位置 (秒)"""
+        return self.start_offset + self.frames * self.FRAME_INTERVAL
+
+
+def _queue_lengths() -> dict:
+    """抓取指标时计算：当前只有一个全局播放队列，按已连接的服务器打标签"""
+    guilds = [str(vc.guild.id) for vc in bot.voice_clients] or ["none"]
+    return {(guild,): len(music_player.play_queue) for guild in guilds}
+
+
+player_queue_length.set_function(_queue_lengths)
+
+
 async def ensure_voice(interaction: Interaction, check_voice: bool = False) -> Optional[VoiceClient]:
     """确保 bot 加入语音频道"""
     try:
@@ -65,8 +181,7 @@ async def ensure_voice(interaction: Interaction, check_voice: bool = False) -> O
         vc = interaction.guild.voice_client
 
         if vc is None or not vc.is_connected():
-            connect_kwargs = {"reconnect": True, "timeout": 60, "self_deaf": True}
-            vc = await channel.connect(**connect_kwargs)
+            vc = await channel.connect(**CONNECT_KWARGS)
             print(f"DEBUG: Bot successfully connected/reconnected to {channel.name}.")
             await interaction.followup.send(f"✅ 已成功加入频道: **{channel.name}** 🚀", ephemeral=True)
 
@@ -86,20 +201,165 @@ async def ensure_voice(interaction: Interaction, check_voice: bool = False) -> O
         return None
 
 
-def play_track(voice_client: VoiceClient, path: Path, seek_time: int = 0):
+async def warm_voice():
+    """连接所有常驻频道 (已连接的跳过)"""
+    for channel_id in WARM_CHANNELS:
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            print(f"WARNING: 找不到常驻语音频道 {channel_id}。")
+            continue
+        vc = channel.guild.voice_client
+        if vc is not None and vc.is_connected():
+            continue
+        try:
+            await channel.connect(**CONNECT_KWARGS)
+            print(f"DEBUG: 已连接常驻语音频道 {channel.name}。")
+        except Exception as e:
+            print(f"WARNING: 连接常驻语音频道 {channel.name} 失败: {e}")
+
+
+_release_task: Optional[asyncio.Task] = None
+
+
+def pause_playback(vc: VoiceClient):
+    """暂停播放，暂停超过 PAUSE_RELEASE_SECONDS 后释放解码进程"""
+    global _release_task
+    vc.pause()
+    if _release_task:
+        _release_task.cancel()
+    if PAUSE_RELEASE_SECONDS > 0:
+        _release_task = asyncio.get_running_loop().create_task(_release_paused(vc, music_player.current_source))
+    publish("player_changed")
+
+
+async def _release_paused(vc: VoiceClient, source):
+    await asyncio.sleep(PAUSE_RELEASE_SECONDS)
+    queue, index = music_player.play_queue, music_player.current_track_index
+    # 期间已恢复、切歌或断开；边下边播的曲目结束进程会中断写入，保持暂停
+    if not vc.is_paused() or music_player.current_source is not source or source is None or \
+            source.label == "stream" or index >= len(queue):
+        return
+    music_player.released = (queue[index], source.position)
+    music_player.manual_skip = True
+    vc.stop()  # 结束 ffmpeg 进程并关闭管道
+    print(f"DEBUG: 已暂停 {PAUSE_RELEASE_SECONDS:.0f} 秒，释放解码进程 ({queue[index].stem} {source.position:.1f} 秒)。")
+    publish("player_changed")
+
+
+def resume_playback(vc: VoiceClient) -> bool:
+    """恢复播放：解码进程已释放时从记录的位置重新开始；没有暂停的曲目时返回 False"""
+    global _release_task
+    if _release_task:
+        _release_task.cancel()
+        _release_task = None
+    released = music_player.released
+    if released is not None:
+        path, position = released
+        play_track(vc, path, round(position, 2))
+    elif vc.is_paused():
+        vc.resume()
+        publish("player_changed")
+    else:
+        return False
+    return True
+
+
+async def leave_voice(vc: VoiceClient):
+    """主动离开语音频道 (/leave、无人超时)：不切歌、不续播，断开后由 on_voice_state_update 清空播放器"""
+    music_player.disconnect_requested = True
+    music_player.released = None
+    if vc.is_playing() or vc.is_paused():
+        music_player.manual_skip = True
+        vc.stop()
+    await vc.disconnect()
+
+
+def notify_voice_connected():
+    """on_voice_state_update 看到 bot 进入 (或重新进入) 语音频道时调用"""
+    _voice_connected.set()
+
+
+async def resume_after_reconnect(voice_client: VoiceClient, path: Path, position: float):
+    """
+    音频源被中断：等待语音重连，然后从断点继续播放同一首。
+    discord.py 2.x 的 AudioPlayer 在自动重连期间会暂停等待，只有重连彻底失败、连接被清理后音频源才会结束，
+    因此这里在 discord.py 放弃后自行重新连接原频道一次。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + VOICE_RESUME_TIMEOUT
+    channel = voice_client.channel
+    rejoined = False
+    print(f"WARNING: 播放中断 ({path.stem} {position:.1f} 秒)，等待语音重连...")
+    while True:
+        if music_player.disconnect_requested:
+            return
+        vc = voice_client.guild.voice_client
+        if vc is not None and vc.is_connected():
+            break
+        if vc is None and channel is not None and not rejoined:
+            # discord.py 已放弃重连并清理了连接
+            rejoined = True
+            try:
+                vc = await channel.connect(**CONNECT_KWARGS)
+                break
+            except Exception as e:
+                print(f"WARNING: 重新连接语音频道 {channel.name} 失败: {e}")
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            print(f"WARNING: {VOICE_RESUME_TIMEOUT:.0f} 秒内未能重连语音，保留播放队列。")
+            publish("player_changed")
+            return
+        _voice_connected.clear()
+        try:
+            # 由 on_voice_state_update 唤醒；同时定期检查，防止错过事件
+            await asyncio.wait_for(_voice_connected.wait(), min(remaining, 1.0))
+        except asyncio.TimeoutError:
+            pass
+
+    queue, index = music_player.play_queue, music_player.current_track_index
+    if index >= len(queue) or queue[index] != path:
+        # 等待期间队列已被命令修改
+        return
+    print(f"DEBUG: 语音已重连，从 {position:.1f} 秒继续播放 {path.stem}。")
+    play_track(vc, path, round(position, 2))
+
+
+def _finalize(tee_path: Path, path: Path, duration: float, error):
+    try:
+        finalize_stream(tee_path, path, duration, error)
+    finally:
+        with _finalizing_lock:
+            _finalizing.discard(path)
+
+
+def play_track(voice_client: VoiceClient, path: Path, seek_time: float = 0, stream: Optional[dict] = None):
     """
     停止当前播放并开始播放新曲目。
     使用标准 FFmpegPCMAudio 实现。
+    传入 stream (downloader.resolve_stream 的结果) 时直接播放网络音频，并同时写入 path。
     """
     # 停止当前播放，防止堆叠
     voice_client.stop()
+    music_player.released = None
 
     before_options = FFMPEG_BEFORE_OPTIONS
-    if seek_time > 0:
-        before_options = f'-ss {seek_time} {FFMPEG_BEFORE_OPTIONS}'
+    options = FFMPEG_OPTIONS
+    tee_path = None
+
+    if stream:
+        # --- 边下边播：一个 ffmpeg 进程同时输出 PCM (推流) 和 mp3 (写入音乐库) ---
+        ffmpeg_input_path = stream["url"]
+        before_options = stream_input_options(stream)
+        if seek_time <= 0 and stream.get("save", True):
+            tee_path = path.with_name(path.name + ".part")
+            options = (f'{FFMPEG_TEE_OPTIONS} {shlex.quote(str(tee_path))} '
+                       f'{FFMPEG_OPTIONS} {FFMPEG_PCM_OUTPUT_OPTIONS}')
+    else:
+        # --- 标准路径 ---
+        ffmpeg_input_path = str(path)
 
-    # --- 标准路径 ---
-    ffmpeg_input_path = str(path)
+    if seek_time > 0:
+        before_options = f'-ss {seek_time} {before_options}'
 
     print(f"\n[FINAL PLAY DEBUG] FFmpeg Input Path: {ffmpeg_input_path}")
     print(f"[FINAL PLAY DEBUG] File Exists: {path.exists()}")
@@ -115,9 +375,23 @@ def play_track(voice_client: VoiceClient, path: Path, seek_time: int = 0):
             music_player.manual_skip = False
             return
 
+        # 出错或语音连接已断开：音频源是被中断的，而不是播放完毕，不切到下一首
+        if error is not None or not voice_client.is_connected():
+            position = source.position
+            last = music_player.interrupted_at
+            if last is not None and last[0] == path and abs(position - last[1]) < VOICE_RESUME_MIN_PROGRESS:
+                # 续播后在同一位置再次中断：重试只会重复失败，切到下一首
+                print(f"WARNING: {path.stem} 在 {position:.1f} 秒处再次中断，跳过该曲目。")
+            elif not stream:
+                music_player.interrupted_at = (path, position)
+                await resume_after_reconnect(voice_client, path, position)
+                return
+        music_player.interrupted_at = None
+
         if not music_player.play_queue:
             if voice_client and voice_client.is_playing():
                 voice_client.stop()
+            publish("player_changed")
             return
 
         # 1. 队列/模式逻辑 (计算下一首的索引)
@@ -139,6 +413,7 @@ def play_track(voice_client: VoiceClient, path: Path, seek_time: int = 0):
                 music_player.current_track_index = 0
                 if voice_client and voice_client.is_playing():
                     voice_client.stop()
+                publish("player_changed")
                 return
 
         # 2. 关键修复：延迟并播放下一首
@@ -148,75 +423,100 @@ def play_track(voice_client: VoiceClient, path: Path, seek_time: int = 0):
         # 【核心修复】强制等待 0.1 秒，确保前一首歌的 stop() 清理完成，避免 ClientException
         await asyncio.sleep(0.1)
 
+        with _finalizing_lock:
+            replay = stream is not None and next_path == path and path in _finalizing
+        if replay:
+            # 单曲循环时串流文件还在转正：再次从网络播放，不重复写入
+            voice_client.loop.run_in_executor(None, lambda: play_track(voice_client, next_path,
+                                                                        stream=dict(stream, save=False)))
+            return
+
         # 递归调用 play_track 来播放下一首
         voice_client.loop.run_in_executor(None, lambda: play_track(voice_client, next_path))
 
     def after_playing_callback(error):
         """播放完成后执行的回调函数 (在单独的线程中运行)"""
+        if tee_path:
+            # 串流结束：检查完整性并入库 (ffprobe/转码放到后台线程，避免延迟下一首)
+            with _finalizing_lock:
+                _finalizing.add(path)
+            threading.Thread(target=_finalize, args=(tee_path, path, stream["duration"], error),
+                             daemon=True).start()
+
         # 将异步调度任务安全地提交给 Bot 的主事件循环
         coro = schedule_next_track_async(error)
         asyncio.run_coroutine_threadsafe(coro, voice_client.loop)
 
     # FFmpeg 音频源：标准启动方式 (使用 FFmpegPCMAudio)
+    spawned_at = time.perf_counter()
     try:
         raw_source = FFmpegPCMAudio(
             source=ffmpeg_input_path,
             before_options=before_options,
-            options=FFMPEG_OPTIONS,  # 使用优化后的 FFMPEG_OPTIONS
+            options=options,  # 使用优化后的 FFMPEG_OPTIONS
         )
     except Exception as e:
         print(f"CRITICAL ERROR: Failed to create FFmpegPCMAudio source: {e}")
         return
 
     # 音量控制器
-    source = discord.PCMVolumeTransformer(raw_source, music_player.current_volume)
+    source = MonitoredVolumeTransformer(raw_source, music_player.current_volume, spawned_at=spawned_at,
+                                        source_label="stream" if stream else "file", start_offset=seek_time)
 
     # 播放
+    music_player.current_source = source
     voice_client.play(source, after=after_playing_callback)
+    publish("player_changed")
+    if not stream:
+        # 在线程池中读取时长 (play_track 也会在线程池中被调用，因此提交到 bot 的事件循环)
+        asyncio.run_coroutine_threadsafe(warm_duration(path), voice_client.loop)
+
+
+def _autocomplete_entries(library) -> tuple:
+    """补全候选 (每个索引快照只构建一次)：(类型, 小写匹配键, 选项, 列表内歌曲 [(小写匹配键, 选项)])"""
+    entries = []
+    for music in library.items:
+        item_type, name = music.get("type"), music["name"]
+        display_name = f"💽 {name} (播放列表)" if item_type == "playlist" else name
+        songs = ()
+        if item_type == "playlist":
+            # 匹配键 "列表/歌曲" 已包含歌曲名，只需检查一次
+            songs = tuple((f"{name}/{song_name}".lower(),
+                           app_commands.Choice(name=f"├ 🎵 {song_name}", value=f"{name}/{song_name}"))
+                          for song_name in music["music"])
+        # 显示名包含名称本身，同理只检查显示名
+        entries.append((item_type, display_name.lower(), app_commands.Choice(name=display_name, value=name), songs))
+    return tuple(entries)
 
 
 def autocomplete_music_callback(include_music: bool = False, include_playlist_music: bool = False) -> Callable[
     [Interaction, str], Awaitable[List[app_commands.Choice[str]]]]:
-    # 此函数保持不变
     async def autocomplete_music(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
         """补全播放列表和音乐选项 """
-        music_data = get_music()
+        entries = get_library().memo("autocomplete", _autocomplete_entries)
         choices = []
+        current_lower = current.lower()
 
-        if music_data:
-            current_lower = current.lower()
-
-            for music in music_data:
-                if len(choices) >= 25:
-                    break
-
-                type = music.get("type")
-                name = music["name"]
-
-                if type == "mp3" and not include_music:
-                    continue
-
-                if type == "playlist_song_temp":
-                    continue
+        for item_type, key, choice, songs in entries:
+            if len(choices) >= 25:
+                break
 
-                display_name = name
-                if type == "playlist":
-                    display_name = f"💽 {name} (播放列表)"
+            if item_type == "mp3" and not include_music:
+                continue
 
-                if not current or current_lower in display_name.lower() or current_lower in name.lower():
-                    choices.append(app_commands.Choice(name=display_name, value=name))
+            if not current or current_lower in key:
+                choices.append(choice)
 
-                if len(choices) >= 25:
-                    continue
+            if len(choices) >= 25:
+                continue
 
-                if type == "playlist" and include_playlist_music:
-                    for song_name in music["music"]:
-                        song_value = f"{music['name']}/{song_name}"
-                        if not current or current_lower in song_name.lower() or current_lower in song_value.lower():
-                            choices.append(app_commands.Choice(name=f"├ 🎵 {song_name}", value=song_value))
+            if songs and include_playlist_music:
+                for song_key, song_choice in songs:
+                    if not current or current_lower in song_key:
+                        choices.append(song_choice)
 
-                            if len(choices) >= 25:
-                                break
+                        if len(choices) >= 25:
+                            break
 
         return choices[:25]
 
@@ -13,7 +13,7 @@ echo ">>> 安装 pip 和 opus..."
 sudo yum install python3-pip opus opus-devel -y
 
 echo ">>> 安装 Python 依赖..."
-pip3 install --user discord.py PyNaCl python-dotenv yt-dlp Flask flask-socketio watchdog psutil
+pip3 install --user discord.py PyNaCl python-dotenv yt-dlp quart hypercorn python-socketio watchdog psutil
 
 DOWNLOADER_PATH="/home/ec2-user/DC_Music_Bot_2.0/downloader.py"
 echo ">>> 修改 downloader.py 启用 cookies..."
@@ -42,6 +42,9 @@ while true; do
 done
 echo ">>> Cookie 已保存到 cookies.txt"
 
+echo ">>> 检查所有模块能否导入..."
+python3 benchmarks/check_imports.py || { echo ">>> 模块导入失败，已停止部署。"; exit 1; }
+
 echo ">>> 配置 systemd 服务..."
 SERVICE_PATH="/etc/systemd/system/musicbot_flask.service"
 sudo tee $SERVICE_PATH > /dev/null <<EOL
@@ -0,0 +1,113 @@
+# diagnostics.py
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from metrics import Histogram
+
+# --- 卡顿诊断：语音帧读取记录 + 事件循环延迟 ---
+# 环形缓冲区只保留最近的数据，热路径上只有一次 deque.append
+FRAME_LOG_SIZE = 3000  # 约 60 秒的音频帧 (每帧 20ms)
+LOOP_LAG_LOG_SIZE = 600
+LOOP_LAG_INTERVAL = 0.1
+LOOP_LAG_WARN = 0.25
+FRAME_INTERVAL = 0.02
+SLOW_START = 0.5  # 首帧之前的单次读取超过该值视为启动慢
+
+# (时间戳, 读取耗时, 相对 20ms 节拍的延迟, 是否空读, 是否在首帧之前)
+frame_log: Deque[Tuple[float, float, float, bool, bool]] = deque(maxlen=FRAME_LOG_SIZE)
+# (时间戳, 事件循环延迟)
+loop_lag_log: Deque[Tuple[float, float]] = deque(maxlen=LOOP_LAG_LOG_SIZE)
+
+loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟 (bot 与 web 共用一个循环)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+def record_frame(read_time: float, lateness: float, empty: bool, startup: bool = False):
+    """记录一次音频帧读取 (在语音发送线程中调用)；startup 表示 ffmpeg 还没给出第一帧"""
+    frame_log.append((time.time(), read_time, lateness, empty, startup))
+
+
+async def monitor_loop_lag():
+    """定时 sleep，实际唤醒时间与预期的差值即为事件循环被阻塞的时长"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL)
+        loop_lag.observe(lag)
+        loop_lag_log.append((time.time(), lag))
+        if lag > LOOP_LAG_WARN:
+            print(f"WARNING: 事件循环阻塞了 {lag * 1000:.0f} ms。")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def _ms(value: float) -> float:
+    return round(value * 1000, 2)
+
+
+def snapshot(worst: int = 5) -> Dict:
+    """汇总最近的记录，供调试命令和 web 界面使用"""
+    frames = list(frame_log)
+    lags = list(loop_lag_log)
+    # 读取耗时和延迟只统计首帧之后的读取；首帧之前的读取包含 ffmpeg 启动时间，单独统计
+    steady = [f for f in frames if not f[4]]
+    startup_times = [f[1] for f in frames if f[4]]
+    read_times = [f[1] for f in steady]
+    latenesses = [f[2] for f in steady]
+
+    return {
+        "frames": {
+            "count": len(frames),
+            "window_seconds": round(frames[-1][0] - frames[0][0], 1) if frames else 0,
+            "read_p50_ms": _ms(_percentile(read_times, 0.5)),
+            "read_p99_ms": _ms(_percentile(read_times, 0.99)),
+            "read_max_ms": _ms(max(read_times, default=0.0)),
+            "late_frames": sum(1 for value in latenesses if value > FRAME_INTERVAL),
+            "slow_reads": sum(1 for value in read_times if value > FRAME_INTERVAL),
+            "empty_reads": sum(1 for f in frames if f[3]),
+            "startup_reads": len(startup_times),
+            "startup_max_ms": _ms(max(startup_times, default=0.0)),
+            "slow_starts": sum(1 for value in startup_times if value > SLOW_START),
+            "worst": [
+                {"at": round(f[0], 3), "read_ms": _ms(f[1]), "late_ms": _ms(f[2]), "startup": f[4]}
+                for f in sorted(frames, key=lambda f: f[1] + f[2], reverse=True)[:worst]
+            ],
+        },
+        "loop": {
+            "count": len(lags),
+            "lag_p50_ms": _ms(_percentile([lag for _, lag in lags], 0.5)),
+            "lag_p99_ms": _ms(_percentile([lag for _, lag in lags], 0.99)),
+            "lag_max_ms": _ms(max((lag for _, lag in lags), default=0.0)),
+            "worst": [
+                {"at": round(at, 3), "lag_ms": _ms(lag)}
+                for at, lag in sorted(lags, key=lambda item: item[1], reverse=True)[:worst]
+            ],
+        },
+    }
+
+
+def diagnose(stats: Optional[Dict] = None) -> str:
+    """根据统计给出最可能的卡顿原因"""
+    stats = stats or snapshot()
+    frames, loop = stats["frames"], stats["loop"]
+    if not frames["count"]:
+        return "最近没有播放记录。"
+    if loop["lag_max_ms"] > LOOP_LAG_WARN * 1000:
+        return "事件循环曾被阻塞 (同步的 ffprobe / 扫描等)，可能导致语音心跳和推流延迟。"
+    if frames["slow_starts"]:
+        return f"ffmpeg 启动慢 (首帧前最长等待 {frames['startup_max_ms']} ms)：输入源或网络较慢，或 CPU 繁忙。"
+    if frames["slow_reads"] or frames["empty_reads"] > 1:
+        return "ffmpeg 供数不及时 (输入源或网络较慢)，音频源出现读取超时或空读。"
+    if frames["late_frames"]:
+        return "音频源和事件循环正常，延迟来自语音发送线程 (CPU 繁忙或网络抖动)。"
+    return "未发现异常。"
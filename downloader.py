@@ -1,20 +1,183 @@
 # downloader.py 头部
 
-import yt_dlp
-from typing import Optional
+from typing import Optional, Dict, List, Union
 import re
 from tools import download_status
+from dc_config import bot
+from postprocess import process_download
+from metrics import download_queue_depth, downloads_total, download_bytes, download_duration
+from pathlib import Path
 import threading
 import queue
 import os # 确保 os 已导入
-from dotenv import load_dotenv # 导入 load_dotenv
-
-load_dotenv() # 加载 .env 变量
+import sqlite3
+import sys
+import time
 
 fragment = 6
 download_task = queue.Queue()
+download_queue_depth.set_function(download_task.qsize)
 task_id = None
 
+# 下载与串流共用的 yt-dlp 选项 (cookies / 代理)
+common_opts = {
+    "ignoreerrors": True,
+    "quiet": True,
+    #"cookiefile": "cookies.txt"
+}
+# --- 最小改动：添加代理配置 ---
+proxy_url = os.getenv("PROXY_URL")
+if proxy_url:
+    common_opts["proxy"] = proxy_url
+# ----------------------------
+
+# --- 播放感知限速：任一服务器正在播放时，降低下载占用的带宽和 CPU ---
+busy_fragment = int(os.getenv("DOWNLOAD_BUSY_FRAGMENTS", "1"))
+busy_ratelimit = int(os.getenv("DOWNLOAD_BUSY_RATELIMIT", str(2 * 1024 * 1024)))  # 字节/秒
+busy_niceness = 10
+downloading = threading.Event()  # 下载进行中 (供语音帧延迟指标打标签)
+_throttle = {"busy": False, "checked": 0.0}
+
+# --- 持久化任务库：进程重启/崩溃后可恢复未完成的下载任务 ---
+jobs_db = os.getenv("DOWNLOAD_DB") or "downloads.db"
+_db_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+
+def _get_db() -> sqlite3.Connection:
+    """获取 (并在首次调用时初始化) 任务库连接"""
+    global _db_conn
+    if _db_conn is None:
+        _db_conn = sqlite3.connect(jobs_db, timeout=10, check_same_thread=False)
+        _db_conn.execute("PRAGMA journal_mode=WAL")
+        _db_conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                status TEXT NOT NULL,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        _db_conn.commit()
+    return _db_conn
+
+
+def set_job_status(job_id: str, status: str, message: Optional[str] = None):
+    """更新任务状态 (queued / downloading / finished / error)"""
+    with _db_lock:
+        conn = _get_db()
+        conn.execute(
+            "UPDATE download_jobs SET status = ?, message = ?, updated_at = ? WHERE id = ?",
+            (status, message, time.time(), job_id)
+        )
+        conn.commit()
+
+
+def get_job(job_id: str) -> Optional[Dict[str, str]]:
+    """按 ID 查询持久化的任务记录"""
+    with _db_lock:
+        row = _get_db().execute(
+            "SELECT id, url, folder, status, message FROM download_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if not row:
+        return None
+    return {"id": row[0], "url": row[1], "folder": row[2], "status": row[3], "message": row[4]}
+
+
+def add_task(job_id: str, url: str, folder) -> None:
+    """写入任务库后加入下载队列"""
+    now = time.time()
+    with _db_lock:
+        conn = _get_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO download_jobs (id, url, folder, status, message, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', NULL, ?, ?)",
+            (job_id, url, str(folder), now, now)
+        )
+        conn.commit()
+    download_task.put({"id": job_id, "url": url, "folder": folder})
+
+
+def restore_tasks() -> int:
+    """启动时把未完成 (queued / downloading) 的任务重新放回队列"""
+    with _db_lock:
+        rows: List[tuple] = _get_db().execute(
+            "SELECT id, url, folder FROM download_jobs WHERE status IN ('queued', 'downloading') "
+            "ORDER BY created_at"
+        ).fetchall()
+    for job_id, url, folder in rows:
+        set_job_status(job_id, "queued")
+        download_task.put({"id": job_id, "url": url, "folder": folder})
+    if rows:
+        print(f"DEBUG: 已恢复 {len(rows)} 个未完成的下载任务。")
+    return len(rows)
+
+def is_playing() -> bool:
+    """是否有任一服务器正在播放"""
+    return any(vc.is_playing() for vc in list(bot.voice_clients))
+
+
+def _set_niceness(value: int):
+    """调整当前线程的优先级，之后派生的进程会继承 (仅 Linux 支持线程级 nice)"""
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), value)
+    except OSError as e:
+        print(f"WARNING: 调整后处理线程优先级失败: {e}")
+
+
+def run_niced(func, *args):
+    """
+    在新线程中执行后处理 (ffmpeg 转码、元数据分析) 并等待结果：正在播放时只降低这个线程和它派生的进程的优先级。
+    新线程继承下载线程的默认优先级；普通用户无法把优先级调回，因此不对长期存在的下载线程调整。
+    """
+    result = {}
+
+    def target():
+        if is_playing():
+            _set_niceness(busy_niceness)
+        try:
+            result["value"] = func(*args)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True, name="download-postprocess")
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def apply_throttle(params: dict, force: bool = False):
+    """根据播放状态调整 yt-dlp 参数 (params 为 YoutubeDL 实例共享的参数字典，可在下载中途生效)"""
+    now = time.monotonic()
+    if not force and now - _throttle["checked"] < 1.0:
+        return
+    _throttle["checked"] = now
+
+    busy = is_playing()
+    if not force and busy == _throttle["busy"]:
+        return
+    _throttle["busy"] = busy
+
+    if busy:
+        params["ratelimit"] = busy_ratelimit
+        params["concurrent_fragment_downloads"] = busy_fragment
+        params["postprocessor_args"] = {"extractaudio": ["-threads", "1"]}
+    else:
+        params.pop("ratelimit", None)
+        params["concurrent_fragment_downloads"] = fragment
+        params.pop("postprocessor_args", None)
+    print(f"DEBUG: 下载限速{'已开启 (正在播放)' if busy else '已解除 (空闲)'}。")
+
+
 def extract_url(url) -> Optional[str]:
     """提取视频网址并重构"""
     platforms = {
@@ -49,59 +212,104 @@ def extract_url(url) -> Optional[str]:
                 return cfg["rebuild"](match.group(1))        
     return None
 
+def resolve_stream(url: str) -> Optional[Dict[str, Union[str, float, dict]]]:
+    """解析视频的音频直链 (不下载)，供边下边播使用"""
+    valid_url = extract_url(url)
+    if not valid_url:
+        return None
+
+    import yt_dlp  # yt-dlp 导入较慢，用到时再导入
+
+    opts = {"format": "bestaudio/best", "noplaylist": True, **common_opts}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(valid_url, download=False)
+    if not info or not info.get("url"):
+        return None
+
+    return {
+        "url": info["url"],
+        "headers": info.get("http_headers", {}),
+        "title": info.get("title") or valid_url,
+        "duration": float(info.get("duration") or 0),
+        "source": valid_url,
+    }
+
 def video_mp3():
     """下载视频保存为 mp3"""
     try:
+        # 在下载线程中导入 yt-dlp，不占用启动时间
+        import yt_dlp
+        from yt_dlp.postprocessor import FFmpegExtractAudioPP
+
         global task_id
+        # 记录当前任务的标题，供完成状态使用
+        current_job = {"title": None, "ydl": None, "files": []}
 
         def hook(d: dict):
             """处理 yt_dlp 下载信息"""
             status = d.get("status", "无状态")
 
             if status == "downloading": 
-                total = d.get("total_bytes", 0) 
+                ydl = current_job.get("ydl")
+                if ydl:
+                    apply_throttle(ydl.params)
+                total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
                 downloaded = d.get("downloaded_bytes", 0)
                 extra = round(downloaded / total * 100, 2) if total else 0.0
 
             elif status == "error":
                 extra = str(d)
 
+            elif status == "finished":
+                download_bytes.inc(d.get("total_bytes") or d.get("downloaded_bytes") or 0)
+
             if status in ["downloading", "error"]:
                 title = d.get("info_dict", {}).get("title", "无标题")
+                current_job["title"] = title
                 data = {
                     "id": task_id,
                     "status": status,
                     "title": title,
                     "extra": extra,
                 }
+                if status == "downloading":
+                    data["progress"] = f"{extra}%"
+                    data["eta"] = f"{d['eta']} 秒" if d.get("eta") is not None else "未知"
+                else:
+                    data["message"] = d.get("message", extra)
                 download_status(data)
 
+        def pp_hook(d: dict):
+            """记录后处理完成后的最终文件路径"""
+            if d.get("status") == "finished" and d.get("postprocessor") == "MoveFiles":
+                filepath = d.get("info_dict", {}).get("filepath")
+                if filepath:
+                    current_job["files"].append(filepath)
+
         ydl_opts = {
             "format": "bestaudio/best",
             "outtmpl": None,
-            "postprocessors": [{   
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "320",
-            }],
-            "ignoreerrors": True,
-            "quiet": True,
             'progress_hooks': [hook],
+            'postprocessor_hooks': [pp_hook],
             "concurrent_fragment_downloads": fragment,
-            #"cookiefile": "cookies.txt"
+            **common_opts,
         }
-        # --- 最小改动：添加代理配置 ---
-        proxy_url = os.getenv("PROXY_URL")
-        if proxy_url:
-            ydl_opts["proxy"] = proxy_url
-        # ----------------------------
+        # 断点续传：保留 .part 文件，重启后从已下载部分继续
+        ydl_opts["continuedl"] = True
+        ydl_opts["nopart"] = False
+
+        restore_tasks()
         while True:
+            data = download_task.get()
+            url = data.get("url")
+            valid_url = extract_url(url)
+            task_id = data.get("id")
+            current_job["title"] = None
+            current_job["files"] = []
+            started = time.perf_counter()
+            result = "error"
+
             try:
-                data = download_task.get(timeout=0.01) 
-                url = data.get("url")
-                valid_url = extract_url(url)
-                task_id = data.get("id")
-                
                 if valid_url:
                     folder = data.get("folder")
                     folder = str(folder).replace("\\", "/") 
@@ -109,13 +317,52 @@ def video_mp3():
 
                     os.makedirs(match.group(1), exist_ok=True) 
                     ydl_opts['outtmpl'] = folder
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        ydl.download([valid_url])
+                    set_job_status(task_id, "downloading")
+                    downloading.set()
+                    try:
+                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                            current_job["ydl"] = ydl
+                            # 提取音频 (ffmpeg) 在单独的线程中运行，按开始时的播放状态决定优先级
+                            extract_audio = FFmpegExtractAudioPP(ydl, preferredcodec="mp3", preferredquality="320")
+                            extract_run = extract_audio.run
+                            extract_audio.run = lambda info: run_niced(extract_run, info)
+                            ydl.add_post_processor(extract_audio, when="post_process")
+                            apply_throttle(ydl.params, force=True)
+                            retcode = ydl.download([valid_url])
+                    finally:
+                        current_job["ydl"] = None
+                        downloading.clear()
+
+                    if retcode == 0:
+                        # 后处理阶段：提取元数据并直接插入索引，无需全量扫描
+                        for filepath in current_job["files"]:
+                            run_niced(process_download, Path(filepath))
+                        set_job_status(task_id, "finished")
+                        result = "finished"
+                        download_status({"id": task_id, "status": "finished", "title": current_job["title"],
+                                         "filename": current_job["title"], "extra": 100.0})
+                    else:
+                        set_job_status(task_id, "error", "yt-dlp 下载失败")
                 else:
+                    set_job_status(task_id, "error", "请输入正确的 url!")
                     hook({"status": "error", "message": "请输入正确的 url!"})
-            except queue.Empty:
-                continue  
+            except Exception as e:
+                # 单个任务失败不影响后续任务
+                print(f"下载任务 {task_id} 失败: {e}")
+                set_job_status(task_id, "error", str(e))
+                hook({"status": "error", "message": str(e)})
+            finally:
+                downloads_total.labels(result).inc()
+                download_duration.observe(time.perf_counter() - started)
     except Exception as e:
         print(f"下载视频保存为 mp3 失败: {e}")
 
-threading.Thread(target=video_mp3, daemon=True).start()
\ No newline at end of file
+_worker: Optional[threading.Thread] = None
+
+
+def start():
+    """启动下载线程 (由 app.main 调用，只启动一次)"""
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=video_mp3, daemon=True, name="downloader")
+        _worker.start()
\ No newline at end of file
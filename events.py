@@ -0,0 +1,24 @@
+# events.py
+
+from typing import Any, Callable, Dict, List, Optional
+
+# 进程内事件总线：模块之间通过主题发布/订阅状态变化，避免互相导入
+# 主题：download_progress (下载进度)、library_changed (索引变化)、player_changed (播放器状态变化)
+_subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+
+
+def subscribe(topic: str, callback: Optional[Callable[[Any], None]] = None):
+    """订阅主题并返回回调本身；省略 callback 时返回装饰器 (@subscribe("topic"))"""
+    if callback is None:
+        return lambda func: subscribe(topic, func)
+    _subscribers.setdefault(topic, []).append(callback)
+    return callback
+
+
+def publish(topic: str, payload: Any = None):
+    """同步调用主题的所有订阅者 (可能在任意线程中调用)"""
+    for callback in list(_subscribers.get(topic, ())):
+        try:
+            callback(payload)
+        except Exception as e:
+            print(f"ERROR: 事件 {topic} 的订阅者执行失败: {e}")
@@ -0,0 +1,242 @@
+# library.py
+
+import os
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+# --- 紧凑的音乐库索引 ---
+# 所有歌曲按 "单曲在前、播放列表按首次出现" 的顺序存放在两列中：
+#   stems: 歌曲名 (文件名去掉扩展名)，exts: 扩展名 (intern 后所有歌曲共享少数几个字符串)
+# 条目 (单曲或播放列表) 只记录所在目录和它在列中的区间 [start, stop)，
+# 歌曲名列表和 Path 在读取时按需生成，不再为每首歌保存一个 Path 对象和 dict。
+
+
+class SongColumns:
+    """
+    快照共享的歌曲列。只会在末尾追加 (增量插入)，已发布条目引用的区间永不修改，
+    因此旧快照的读者不受影响；全量扫描或 compact() 时重新构建，回收增量插入留下的旧区间。
+    """
+    __slots__ = ("stems", "exts", "dead")
+
+    def __init__(self):
+        self.stems: List[str] = []
+        self.exts: List[str] = []
+        self.dead = 0  # 不再被当前条目引用的旧区间的歌曲数
+
+    def append(self, songs: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+        """追加歌曲 (名称, 扩展名)，返回它们的区间"""
+        start = len(self.stems)
+        for stem, ext in songs:
+            self.stems.append(stem)
+            self.exts.append(sys.intern(ext))
+        return start, len(self.stems)
+
+
+class SongNames(Sequence):
+    """条目的歌曲名 (只读视图)"""
+    __slots__ = ("_columns", "_start", "_stop")
+
+    def __init__(self, columns: SongColumns, start: int, stop: int):
+        self._columns = columns
+        self._start = start
+        self._stop = stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def _position(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("song index out of range")
+        return self._start + index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._columns.stems[self._start:self._stop][index]
+        return self._columns.stems[self._position(index)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns.stems[self._start:self._stop])
+
+    def __contains__(self, name) -> bool:
+        try:
+            self.index(name)
+            return True
+        except ValueError:
+            return False
+
+    def index(self, name, start: int = 0, stop: Optional[int] = None) -> int:
+        stop = len(self) if stop is None else min(stop, len(self))
+        return self._columns.stems.index(name, self._start + start, self._start + stop) - self._start
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class SongPaths(SongNames):
+    """条目的歌曲路径 (只读视图，访问时才构造 Path)"""
+    __slots__ = ("_folder",)
+
+    def __init__(self, columns: SongColumns, start: int, stop: int, folder: Path):
+        super().__init__(columns, start, stop)
+        self._folder = folder
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        position = self._position(index)
+        return self._folder / (self._columns.stems[position] + self._columns.exts[position])
+
+    def __iter__(self) -> Iterator[Path]:
+        folder, columns = self._folder, self._columns
+        for position in range(self._start, self._stop):
+            yield folder / (columns.stems[position] + columns.exts[position])
+
+    def __contains__(self, path) -> bool:
+        return isinstance(path, Path) and path.parent == self._folder and \
+            self._find(path.stem, path.suffix) is not None
+
+    def index(self, path, start: int = 0, stop: Optional[int] = None) -> int:
+        position = self._find(path.stem, path.suffix) if isinstance(path, Path) and path.parent == self._folder \
+            else None
+        if position is None or not start <= position - self._start < (len(self) if stop is None else stop):
+            raise ValueError(f"{path} is not in the list")
+        return position - self._start
+
+    def _find(self, stem: str, ext: str) -> Optional[int]:
+        stems, exts = self._columns.stems, self._columns.exts
+        position = self._start
+        while True:
+            try:
+                position = stems.index(stem, position, self._stop)
+            except ValueError:
+                return None
+            if exts[position] == ext:
+                return position
+            position += 1
+
+
+class LibraryItem:
+    """
+    索引条目 (单曲 "mp3" 或播放列表 "playlist")，兼容原先 dict 条目的读取方式：
+    item["type"] / item["name"] / item["paths"]，播放列表另有 item["music"] / item["music_count"]。
+    """
+    __slots__ = ("type", "name", "folder", "columns", "start", "stop")
+
+    def __init__(self, item_type: str, name: str, folder: Path, columns: SongColumns, start: int, stop: int):
+        self.type = item_type
+        self.name = name
+        self.folder = folder  # 歌曲所在目录 (单曲为音乐库根目录)
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "type":
+            return self.type
+        if key == "name":
+            return self.name
+        if key == "paths":
+            return SongPaths(self.columns, self.start, self.stop, self.folder)
+        if self.type == "playlist":
+            if key == "music":
+                return SongNames(self.columns, self.start, self.stop)
+            if key == "music_count":
+                return self.stop - self.start
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def song_path(self, name: str) -> Optional[Path]:
+        """按歌曲名查找 (同名时取第一首)，不存在时返回 None"""
+        try:
+            position = self.columns.stems.index(name, self.start, self.stop)
+        except ValueError:
+            return None
+        return self.folder / (name + self.columns.exts[position])
+
+    def songs(self) -> Iterator[Tuple[str, str]]:
+        """(歌曲名, 扩展名)"""
+        return zip(self.columns.stems[self.start:self.stop], self.columns.exts[self.start:self.stop])
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __repr__(self) -> str:
+        return f"LibraryItem({self.type!r}, {self.name!r}, songs={len(self)})"
+
+
+class LibrarySnapshot:
+    """
+    不可变的音乐库索引快照：发布后不再修改，更新时整体替换 (引用的替换是原子的)。
+    读者取得当前快照即可无锁遍历；由快照派生的数据 (web 列表、补全键等) 按快照缓存。
+    """
+    __slots__ = ("version", "items", "columns", "scanned_at", "_memo")
+
+    def __init__(self, version: int, items: Tuple[LibraryItem, ...], columns: SongColumns, scanned_at: float):
+        self.version = version  # 每次全量扫描或增量插入后递增
+        self.items = items
+        self.columns = columns
+        self.scanned_at = scanned_at  # 最近一次全量扫描的时间，0 表示尚未扫描
+        self._memo: Dict[Hashable, Any] = {}
+
+    def memo(self, key: Hashable, build: Callable[["LibrarySnapshot"], Any]) -> Any:
+        """按快照缓存派生数据；并发首次计算时可能重复构建，但结果相同，保留先写入的一份"""
+        try:
+            return self._memo[key]
+        except KeyError:
+            return self._memo.setdefault(key, build(self))
+
+    def song_count(self) -> int:
+        return sum(len(item) for item in self.items)
+
+
+def compact(items: Iterable[LibraryItem]) -> Tuple[Tuple[LibraryItem, ...], SongColumns]:
+    """把条目复制到新的歌曲列中 (去掉旧区间)，旧快照继续引用原来的列"""
+    columns = SongColumns()
+    return tuple(LibraryItem(item.type, item.name, item.folder, columns, *columns.append(item.songs()))
+                 for item in items), columns
+
+
+def build_items(music_path: Path, files: Iterable[Path]) -> Tuple[Tuple[LibraryItem, ...], SongColumns]:
+    """
+    由扫描到的文件构建条目 (支持嵌套文件夹作为播放列表)：单曲在前，播放列表按首次出现的顺序，
+    嵌套目录 "FolderA/SubFolderB" 是一个独立的播放列表。
+    """
+    singles: List[Tuple[str, str]] = []
+    playlists: Dict[str, List[Tuple[str, str]]] = {}
+    root = Path('.')
+
+    for file_path in files:
+        # 计算相对于 music_dir 的路径
+        try:
+            relative_path = file_path.relative_to(music_path)
+        except ValueError:
+            # 文件不在 music_dir 下，跳过
+            continue
+
+        song = (file_path.stem, file_path.suffix)
+        relative_dir_path = relative_path.parent
+        if relative_dir_path != root:
+            # 播放列表：使用相对目录路径作为播放列表名，使用 '/' 作为内部连接符
+            playlist_name = str(relative_dir_path).replace(os.path.sep, '/')
+            playlists.setdefault(playlist_name, []).append(song)
+        else:
+            # 根目录歌曲 (单曲)
+            singles.append(song)
+
+    columns = SongColumns()
+    items = []
+    for song in singles:
+        items.append(LibraryItem("mp3", song[0], music_path, columns, *columns.append((song,))))
+    for playlist_name, songs in playlists.items():
+        items.append(LibraryItem("playlist", playlist_name, music_path / playlist_name, columns,
+                                 *columns.append(songs)))
+    return tuple(items), columns
@@ -0,0 +1,219 @@
+# metrics.py
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# 轻量级指标：热路径上只做一次加法/二分查找，不加锁 (依赖 GIL，允许极少量误差)
+_registry: List["_Metric"] = []
+
+
+class _Metric:
+    """指标基类：支持按标签拆分子指标"""
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        _registry.append(self)
+
+    def labels(self, *values) -> "_Metric":
+        """获取 (必要时创建) 对应标签值的子指标"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._new_child()
+            self._children[key] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (), _child: bool = False):
+        self.value = 0.0
+        if not _child:
+            super().__init__(name, description, labelnames)
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.description, _child=True)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Histogram(_Metric):
+    """固定桶直方图"""
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Optional[Sequence[float]] = None, _child: bool = False):
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        if not _child:
+            super().__init__(name, description, labelnames)
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.description, buckets=self.buckets, _child=True)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；也可以设置回调，在抓取时才计算 (热路径零开销)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (), _child: bool = False):
+        self.value = 0.0
+        self._function: Optional[Callable[[], Union[float, Dict[Tuple, float]]]] = None
+        if not _child:
+            super().__init__(name, description, labelnames)
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.description, _child=True)
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], Union[float, Dict[Tuple, float]]]):
+        """设置抓取时调用的回调；带标签的指标返回 {标签值元组: 值}"""
+        self._function = function
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _samples(metric: _Metric):
+    """返回 [(标签值元组, 指标实例)]"""
+    if metric.labelnames:
+        return list(metric._children.items())
+    return [((), metric)]
+
+
+def _render_metric(metric: _Metric) -> List[str]:
+    lines = [f"# HELP {metric.name} {metric.description}", f"# TYPE {metric.name} {metric.kind}"]
+    if isinstance(metric, Gauge) and metric._function is not None:
+        try:
+            result = metric._function()
+        except Exception as e:
+            print(f"WARNING: 计算指标 {metric.name} 失败: {e}")
+            return lines
+        items = result.items() if isinstance(result, dict) else [((), result)]
+        for values, value in items:
+            lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} {_format_value(value)}")
+        return lines
+
+    for values, child in _samples(metric):
+        if isinstance(child, Histogram):
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = _format_labels(metric.labelnames + ("le",), values + (_format_value(bound),))
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, values)
+            lines.append(f"{metric.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{metric.name}_count{labels} {child.count}")
+        else:
+            lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} {_format_value(child.value)}")
+    return lines
+
+
+def render() -> str:
+    """以 Prometheus 文本格式输出所有指标"""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(_render_metric(metric))
+    return "\n".join(lines) + "\n"
+
+
+# --- 斜杠命令 ---
+command_latency = Histogram(
+    "discord_command_duration_seconds",
+    "斜杠命令处理耗时",
+    labelnames=("command",),
+)
+
+# --- 播放 ---
+ffmpeg_first_frame = Histogram(
+    "ffmpeg_first_frame_seconds",
+    "从启动 ffmpeg 到读出第一帧音频的时间",
+    labelnames=("source",),
+)
+player_queue_length = Gauge(
+    "player_queue_length",
+    "播放队列长度",
+    labelnames=("guild",),
+)
+
+# --- 语音发送 ---
+voice_frame_lateness = Histogram(
+    "voice_frame_lateness_seconds",
+    "语音帧相对 20ms 发送节拍的延迟",
+    labelnames=("downloading",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.5),
+)
+voice_late_frames = Counter(
+    "voice_late_frames_total",
+    "延迟超过 20ms 的语音帧数量",
+    labelnames=("downloading",),
+)
+voice_underruns = Counter(
+    "voice_underruns_total",
+    "音频源读不出完整一帧 (ffmpeg 跟不上) 的次数",
+)
+
+# --- 下载 ---
+download_queue_depth = Gauge(
+    "download_queue_depth",
+    "等待下载的任务数量",
+)
+downloads_total = Counter(
+    "downloads_total",
+    "已处理的下载任务",
+    labelnames=("result",),
+)
+download_bytes = Counter(
+    "download_bytes_total",
+    "已下载的字节数",
+)
+download_duration = Histogram(
+    "download_duration_seconds",
+    "单个下载任务 (含后处理) 的耗时",
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+# --- 音乐库 ---
+library_items = Gauge(
+    "library_items",
+    "音乐库索引中的条目数量",
+    labelnames=("type",),
+)
+library_rescan_duration = Histogram(
+    "library_rescan_duration_seconds",
+    "全量扫描音乐库的耗时",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
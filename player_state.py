@@ -0,0 +1,224 @@
+# player_state.py
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dc_config import bot, music_player
+from dc_extra import play_track, CONNECT_KWARGS
+from events import subscribe, publish
+from serializer import dumps
+import tools
+
+# --- 播放状态持久化：进程重启/崩溃后恢复队列、音量、模式和播放位置 ---
+# 日志为追加写入的 JSONL：每次变化只写入与上一条不同的字段 (队列只在变化时写入)，
+# 重放时按顺序合并即可得到最新状态；记录过多时压缩为一条完整快照。
+STATE_JOURNAL = os.getenv("PLAYER_STATE_JOURNAL") or "player_state.jsonl"
+# 播放中记录位置的间隔 (秒)
+CHECKPOINT_INTERVAL = float(os.getenv("PLAYER_STATE_INTERVAL") or 5)
+# 日志超过该记录数时压缩
+COMPACT_RECORDS = 1000
+
+_lock = threading.Lock()
+_file = None
+_records = 0
+# 最近写入的完整状态 (用于计算差异)
+_last: Dict[str, Any] = {}
+# 最近写入的队列对象和长度：未变化时无需逐项比较
+_last_queue: Optional[tuple] = None
+# 启动时从日志恢复的状态
+_saved: Dict[str, Any] = {}
+_worker: Optional[threading.Thread] = None
+# 恢复完成 (或无需恢复) 之前不写入，避免启动时的空闲状态覆盖待恢复的记录
+_recording = False
+_resuming = False
+
+
+def _relative(path: Path) -> str:
+    """音乐库内的文件保存相对路径，音乐库目录移动后仍可恢复"""
+    try:
+        return path.relative_to(tools.music_dir).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def _absolute(name: str) -> Path:
+    path = Path(name)
+    return path if path.is_absolute() else Path(tools.music_dir) / path
+
+
+def capture() -> Dict[str, Any]:
+    """当前播放器状态 (队列未变化时复用上次转换的相对路径)"""
+    global _last_queue
+    vc = tools.active_voice_client()
+    if vc and vc.is_playing():
+        status = "playing"
+    elif vc and vc.is_paused() or music_player.released is not None:
+        status = "paused"
+    else:
+        status = "idle"
+
+    queue = music_player.play_queue
+    if _last_queue and _last_queue[0] is queue and _last_queue[1] == len(queue):
+        queue_names = _last["queue"]
+    else:
+        queue_names = [_relative(path) for path in queue]
+        _last_queue = (queue, len(queue))
+
+    state = {
+        "queue": queue_names,
+        "index": music_player.current_track_index,
+        "volume": music_player.current_volume,
+        "mode": music_player.playback_mode,
+        "position": round(music_player.position(), 1),
+        "status": status,
+    }
+    if vc and vc.channel:
+        state["guild"] = vc.guild.id
+        state["channel"] = vc.channel.id
+    return state
+
+
+def _append(record: Dict[str, Any]):
+    global _records
+    _file.write(dumps(record) + b"\n")
+    # 只 flush 到操作系统，不逐条 fsync：进程崩溃不会丢失，写入足够便宜
+    _file.flush()
+    _records += 1
+
+
+def _compact():
+    """把当前完整状态写成只有一条记录的新日志 (原子替换)"""
+    global _file, _records
+    if _file:
+        _file.close()
+    temp = f"{STATE_JOURNAL}.tmp"
+    with open(temp, "wb") as f:
+        if _last:
+            f.write(dumps(dict(_last, t=round(time.time(), 1))) + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, STATE_JOURNAL)
+    _file = open(STATE_JOURNAL, "ab")
+    _records = 1 if _last else 0
+
+
+@subscribe("player_changed")
+def record(_=None):
+    """追加一条状态变化记录 (只包含变化的字段)"""
+    if _file is None or not _recording or bot.is_closed():
+        # 未启动、尚未恢复，或 bot 正在关闭 (关闭时断开语音会清空队列，不应覆盖已保存的状态)
+        return
+    with _lock:
+        try:
+            state = capture()
+            delta = {key: value for key, value in state.items() if _last.get(key) != value}
+            if not delta:
+                return
+            _last.update(state)
+            delta["t"] = round(time.time(), 1)
+            _append(delta)
+            if _records > COMPACT_RECORDS:
+                _compact()
+        except Exception as e:
+            print(f"ERROR: 保存播放状态失败: {e}")
+
+
+def _resumable(state: Dict[str, Any]) -> bool:
+    return bool(state.get("queue")) and state.get("status") != "idle" and bool(state.get("channel"))
+
+
+def load() -> Dict[str, Any]:
+    """按顺序重放日志；最后一行可能因崩溃而不完整，直接忽略"""
+    state: Dict[str, Any] = {}
+    try:
+        with open(STATE_JOURNAL, "rb") as f:
+            for line in f:
+                try:
+                    state.update(json.loads(line))
+                except ValueError:
+                    print("WARNING: 播放状态日志中有损坏的记录，已跳过。")
+    except FileNotFoundError:
+        pass
+    state.pop("t", None)
+    return state
+
+
+def _checkpoint_loop():
+    # 只有播放位置等字段变化时才会真正写入 (暂停或空闲时不写)
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        record()
+
+
+def start():
+    """读取上次保存的状态并开始记录 (由 app.main 调用，只启动一次)"""
+    global _worker, _recording
+    if _worker is not None:
+        return
+    with _lock:
+        _saved.update(load())
+        _last.update(_saved)
+        _compact()
+    _worker = threading.Thread(target=_checkpoint_loop, daemon=True, name="player-state")
+    _worker.start()
+    if not _resumable(_saved):
+        _recording = True
+    else:
+        print(f"DEBUG: 找到上次的播放状态：{len(_saved['queue'])} 首，第 {_saved.get('index', 0) + 1} 首 "
+              f"{_saved.get('position', 0):.0f} 秒。")
+
+
+async def resume():
+    """bot 就绪后重新加入上次的语音频道，从保存的位置继续播放 (只执行一次)"""
+    global _recording, _resuming
+    if _recording or _resuming:
+        return
+    _resuming = True
+    try:
+        await _resume(dict(_saved))
+    finally:
+        _recording = True
+        record()
+
+
+async def _resume(state: Dict[str, Any]):
+    channel = bot.get_channel(state["channel"])
+    if channel is None:
+        print(f"WARNING: 无法恢复播放：找不到语音频道 {state['channel']}。")
+        return
+
+    # 跳过已被删除的文件
+    queue: List[Path] = [_absolute(name) for name in state["queue"]]
+    index = min(state.get("index", 0), len(queue) - 1)
+    current = queue[index]
+    existing = await tools.run_blocking(lambda: [path for path in queue if path.exists()])
+    if not existing:
+        print("WARNING: 无法恢复播放：队列中的文件都已不存在。")
+        return
+    position = state.get("position", 0) if current in existing else 0
+    index = existing.index(current) if current in existing else min(index, len(existing) - 1)
+
+    try:
+        vc = channel.guild.voice_client
+        if vc is None or not vc.is_connected():
+            vc = await channel.connect(**CONNECT_KWARGS)
+    except Exception as e:
+        print(f"ERROR: 恢复播放时连接语音频道失败: {e}")
+        return
+
+    music_player.play_queue = existing
+    music_player.current_track_index = index
+    music_player.current_volume = state.get("volume", music_player.current_volume)
+    music_player.playback_mode = state.get("mode", music_player.playback_mode)
+    if state.get("status") == "paused":
+        # 暂停中的曲目不启动解码进程，/pause 恢复时再从保存的位置开始
+        music_player.released = (existing[index], position)
+        publish("player_changed")
+        await tools.warm_duration(existing[index])
+    else:
+        play_track(vc, existing[index], round(position, 2))
+    print(f"DEBUG: 已恢复播放：{channel.name} 第 {index + 1}/{len(existing)} 首，{int(position)} 秒。")
@@ -0,0 +1,112 @@
+# postprocess.py
+
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional, Union
+from tools import add_music_file, music_dir
+
+# --- 下载后处理阶段：一次解码完成元数据、响度分析和 Opus 缓存，然后增量更新索引 ---
+# ANALYZE_LOUDNESS=1 时测量 EBU R128 响度；设置 OPUS_CACHE_DIR 时额外生成 Opus 缓存文件
+analyze_loudness = os.getenv("ANALYZE_LOUDNESS", "0") == "1"
+opus_cache_dir = os.getenv("OPUS_CACHE_DIR", "")
+
+# 在 Windows 上隐藏命令行窗口
+_creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+
+
+def opus_cache_path(file_path: Path) -> Optional[Path]:
+    """返回歌曲对应的 Opus 缓存路径 (未启用缓存时返回 None)"""
+    if not opus_cache_dir:
+        return None
+    try:
+        relative_path = file_path.resolve().relative_to(Path(music_dir).resolve())
+    except ValueError:
+        relative_path = Path(file_path.name)
+    return Path(opus_cache_dir) / relative_path.with_suffix(".opus")
+
+
+def probe_tags(file_path: Path) -> Dict[str, Union[str, float]]:
+    """使用 ffprobe 读取时长和标签"""
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration:format_tags=title,artist,album',
+        '-of', 'json',
+        str(file_path)
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True, creationflags=_creationflags)
+    fmt = json.loads(result.stdout).get("format", {})
+    metadata = {"duration": float(fmt.get("duration", 0.0))}
+    for key, value in fmt.get("tags", {}).items():
+        metadata[key.lower()] = value
+    return metadata
+
+
+def analyze_and_transcode(file_path: Path, opus_path: Optional[Path]) -> Dict[str, float]:
+    """一次 ffmpeg 解码同时完成响度分析和 Opus 缓存编码"""
+    command = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-i', str(file_path)]
+    if analyze_loudness:
+        command += ['-map', '0:a', '-af', 'loudnorm=print_format=json', '-f', 'null', '-']
+    if opus_path:
+        opus_path.parent.mkdir(parents=True, exist_ok=True)
+        command += ['-map', '0:a', '-c:a', 'libopus', '-b:a', '128k', '-ar', '48000', '-ac', '2', str(opus_path)]
+
+    result = subprocess.run(command, capture_output=True, text=True, creationflags=_creationflags)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "ffmpeg 失败")
+
+    metadata = {}
+    if analyze_loudness:
+        # loudnorm 在 stderr 末尾输出一段 JSON
+        match = re.search(r"\{[^{}]*\"input_i\"[^{}]*\}", result.stderr)
+        if match:
+            stats = json.loads(match.group(0))
+            metadata["loudness"] = float(stats["input_i"])
+            metadata["true_peak"] = float(stats["input_tp"])
+    return metadata
+
+
+def process_download(file_path: Path) -> Optional[Dict]:
+    """下载完成后的处理阶段，返回插入索引后的条目"""
+    try:
+        metadata = probe_tags(file_path)
+    except Exception as e:
+        print(f"WARNING: 读取 {file_path} 的元数据失败: {e}")
+        metadata = {}
+
+    opus_path = opus_cache_path(file_path)
+    if analyze_loudness or opus_path:
+        try:
+            metadata.update(analyze_and_transcode(file_path, opus_path))
+            if opus_path:
+                metadata["opus_cache"] = str(opus_path)
+        except Exception as e:
+            print(f"WARNING: 分析/转码 {file_path} 失败: {e}")
+
+    return add_music_file(file_path, metadata)
+
+
+def finalize_stream(part_path: Path, final_path: Path, expected_duration: float,
+                    error: Optional[Exception] = None) -> Optional[Dict]:
+    """边下边播结束后：文件完整则转正并入库，否则删除不完整的文件"""
+    complete = False
+    if error is None and expected_duration > 0 and part_path.exists():
+        try:
+            complete = probe_tags(part_path)["duration"] >= expected_duration - 2
+        except Exception as e:
+            print(f"WARNING: 检查串流文件 {part_path} 失败: {e}")
+
+    if not complete:
+        # 被跳过、中断或出错的串流不保留
+        try:
+            part_path.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"WARNING: 删除不完整的串流文件失败: {e}")
+        return None
+
+    os.replace(part_path, final_path)
+    print(f"DEBUG: 串流已完整保存到音乐库: {final_path}")
+    return process_download(final_path)
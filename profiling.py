@@ -0,0 +1,190 @@
+# profiling.py
+
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from metrics import Counter, Histogram, command_latency
+
+# --- 命令 / 路由性能剖析 ---
+# 逐步驱动协程，统计每一步在事件循环上同步执行的时间 (即阻塞事件循环的时间)；
+# 超过阈值时打印明细，并对同一处理函数的下一次调用做一次 cProfile 采样
+slow_threshold = float(os.getenv("PROFILE_SLOW_MS") or 500) / 1000
+PROFILE_TOP = 15
+
+_current: ContextVar[Optional["CallRecord"]] = ContextVar("profile_record", default=None)
+# 慢调用之后，下一次调用需要采样的处理函数
+_sample_next: Dict[str, bool] = {}
+_profiler_busy = False
+_audit_installed = False
+
+route_latency = Histogram(
+    "http_request_duration_seconds",
+    "Web 路由处理耗时",
+    labelnames=("endpoint",),
+)
+loop_blocked = Histogram(
+    "handler_loop_blocked_seconds",
+    "命令 / 路由在事件循环上同步执行 (阻塞其他任务) 的时间",
+    labelnames=("handler",),
+)
+subprocess_spawns = Counter(
+    "subprocess_spawns_total",
+    "启动的子进程数量 (按发起的命令 / 路由统计)",
+    labelnames=("handler",),
+)
+
+
+class CallRecord:
+    """一次调用的剖析数据"""
+    __slots__ = ("name", "blocked", "steps", "max_step", "subprocesses", "programs", "profiler")
+
+    def __init__(self, name: str, profiler: Optional[cProfile.Profile] = None):
+        self.name = name
+        self.blocked = 0.0
+        self.steps = 0
+        self.max_step = 0.0
+        self.subprocesses = 0
+        self.programs: List[str] = []
+        self.profiler = profiler
+
+
+def _audit_hook(event: str, args):
+    # 审计钩子对每个审计事件都会调用，先做最便宜的判断
+    if event != "subprocess.Popen":
+        return
+    record = _current.get()
+    if record is None:
+        subprocess_spawns.labels("other").inc()
+        return
+    record.subprocesses += 1
+    subprocess_spawns.labels(record.name).inc()
+    program = args[0] or args[1]
+    if isinstance(program, (list, tuple)):
+        program = program[0] if program else "?"
+    record.programs.append(os.path.basename(str(program)))
+
+
+def install_audit_hook():
+    """注册子进程审计钩子 (无法注销，只注册一次)"""
+    global _audit_installed
+    if not _audit_installed:
+        sys.addaudithook(_audit_hook)
+        _audit_installed = True
+
+
+class _SteppedCoroutine:
+    """逐步驱动协程并记录每一步的同步执行时间"""
+
+    def __init__(self, coro, record: CallRecord):
+        self.coro = coro
+        self.record = record
+
+    def __await__(self):
+        coro, record = self.coro, self.record
+        value, error = None, None
+        while True:
+            token = _current.set(record)
+            if record.profiler:
+                record.profiler.enable()
+            start = time.perf_counter()
+            try:
+                if error is not None:
+                    yielded = coro.throw(error)
+                else:
+                    yielded = coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                step = time.perf_counter() - start
+                if record.profiler:
+                    record.profiler.disable()
+                _current.reset(token)
+                record.blocked += step
+                record.steps += 1
+                record.max_step = max(record.max_step, step)
+
+            value, error = None, None
+            try:
+                value = yield yielded
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                error = e
+
+
+def _format_programs(programs: List[str]) -> str:
+    counts: Dict[str, int] = {}
+    for program in programs:
+        counts[program] = counts.get(program, 0) + 1
+    return ", ".join(f"{program}×{count}" for program, count in counts.items())
+
+
+def _report(record: CallRecord, wall: float):
+    """打印慢调用明细和采样结果"""
+    detail = (f"耗时 {wall * 1000:.0f} ms (阻塞事件循环 {record.blocked * 1000:.0f} ms, "
+              f"{record.steps} 步, 最长一步 {record.max_step * 1000:.0f} ms, 子进程 {record.subprocesses} 个")
+    if record.programs:
+        detail += f": {_format_programs(record.programs)}"
+    prefix = "WARNING: 慢调用" if wall > slow_threshold else "DEBUG: 采样调用"
+    print(f"{prefix} {record.name} {detail})")
+
+    if record.profiler:
+        stream = io.StringIO()
+        stats = pstats.Stats(record.profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(f"DEBUG: {record.name} 采样结果 (仅统计在事件循环上同步执行的部分):\n{stream.getvalue()}")
+
+
+def _new_profiler(name: str) -> Optional[cProfile.Profile]:
+    """上一次调用偏慢时，为这次调用创建采样器 (同一时刻只允许一个)"""
+    global _profiler_busy
+    if not _sample_next.pop(name, False) or _profiler_busy:
+        return None
+    _profiler_busy = True
+    return cProfile.Profile()
+
+
+def profiled(name: str, kind: str = "command"):
+    """剖析斜杠命令或 web 路由 (放在 @tree.command 和 @app_commands.* 之下)"""
+    label = f"{kind}:{name}"
+    latency = (command_latency if kind == "command" else route_latency).labels(name)
+    blocked = loop_blocked.labels(label)
+
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            global _profiler_busy
+            record = CallRecord(label, _new_profiler(label))
+            start = time.perf_counter()
+            try:
+                return await _SteppedCoroutine(func(*args, **kwargs), record)
+            finally:
+                wall = time.perf_counter() - start
+                latency.observe(wall)
+                blocked.observe(record.blocked)
+                if wall > slow_threshold or record.profiler:
+                    _report(record, wall)
+                    _sample_next[label] = record.profiler is None
+                if record.profiler:
+                    _profiler_busy = False
+
+        return wrapper
+
+    return decorator
+
+
+def profile_routes(app):
+    """包装 app 中已注册的所有路由"""
+    for endpoint, view in list(app.view_functions.items()):
+        app.view_functions[endpoint] = profiled(endpoint, kind="route")(view)
@@ -0,0 +1,55 @@
+# serializer.py
+
+import json
+import os
+from typing import Any, Tuple
+
+# 可插拔序列化：Socket.IO 和 REST 接口共用。已安装 orjson 时默认使用 orjson，
+# REST 接口在客户端声明 Accept: application/msgpack 时返回 MessagePack 二进制。
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+# SOCKETIO_SERIALIZER=json 可强制使用标准库
+serializer_name = os.getenv("SOCKETIO_SERIALIZER", "orjson" if orjson else "json")
+
+
+class OrjsonModule:
+    """供 python-socketio 使用的 json 模块替身 (只需要 dumps / loads)"""
+
+    @staticmethod
+    def dumps(obj: Any, **kwargs) -> str:
+        return orjson.dumps(obj, default=str).decode()
+
+    @staticmethod
+    def loads(s, **kwargs) -> Any:
+        return orjson.loads(s)
+
+
+def socketio_json():
+    """返回 Socket.IO 服务器使用的 json 模块"""
+    if serializer_name == "orjson" and orjson:
+        return OrjsonModule
+    return json
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON 编码为 bytes"""
+    if orjson:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+
+def encode_for(accept: str, obj: Any) -> Tuple[bytes, str]:
+    """按 Accept 头选择编码，返回 (正文, Content-Type)"""
+    if ormsgpack and MSGPACK_MIMETYPE in (accept or ""):
+        return ormsgpack.packb(obj, default=str), MSGPACK_MIMETYPE
+    return dumps(obj), JSON_MIMETYPE
@@ -0,0 +1,49 @@
+# startup.py
+
+import os
+import time
+from typing import Dict
+from metrics import Gauge
+
+# --- 启动耗时预算：记录各阶段距进程入口的耗时，超出预算时打印警告 ---
+# 入口 (app.py) 最先导入本模块，以此作为计时起点
+_started = time.perf_counter()
+_marks: Dict[str, float] = {}
+
+# 各阶段预算 (秒)，可用 STARTUP_BUDGET_<阶段> 覆盖，例如 STARTUP_BUDGET_WEB_READY=2
+BUDGETS = {
+    "imports": 1.5,
+    "web_ready": 2.0,
+    "index_loaded": 10.0,
+    "gateway_ready": 15.0,
+}
+
+startup_phase = Gauge(
+    "startup_phase_seconds",
+    "启动各阶段距进程入口的耗时",
+    labelnames=("phase",),
+)
+startup_phase.set_function(lambda: {(phase,): elapsed for phase, elapsed in _marks.items()})
+
+
+def budget(phase: str) -> float:
+    return float(os.getenv(f"STARTUP_BUDGET_{phase.upper()}") or BUDGETS.get(phase, 0) or 0)
+
+
+def mark(phase: str) -> float:
+    """记录一个启动阶段完成 (每个阶段只记录第一次)"""
+    if phase in _marks:
+        return _marks[phase]
+    elapsed = time.perf_counter() - _started
+    _marks[phase] = elapsed
+    limit = budget(phase)
+    if limit and elapsed > limit:
+        print(f"WARNING: 启动阶段 {phase} 用时 {elapsed:.2f} 秒，超出预算 {limit:.2f} 秒。")
+    else:
+        print(f"DEBUG: 启动阶段 {phase} 完成，用时 {elapsed:.2f} 秒。")
+    return elapsed
+
+
+def report() -> Dict[str, float]:
+    """已完成阶段的耗时 (秒)"""
+    return {phase: round(elapsed, 3) for phase, elapsed in _marks.items()}
@@ -34,6 +34,11 @@ document.addEventListener('DOMContentLoaded', function() {
         themeToggleButton.addEventListener('click', toggleTheme);
     }
 
+    const diagnosticsButton = document.getElementById('diagnostics-button');
+    if (diagnosticsButton) {
+        diagnosticsButton.addEventListener('click', loadDiagnostics);
+    }
+
     const playlistChoiceSelect = document.getElementById('playlist-choice-select');
     const playlistNameInput = document.getElementById('playlist-name');
     if (playlistChoiceSelect && playlistNameInput) {
@@ -116,8 +121,11 @@ function StatusUpdates(socket) {
     socket.on('update_status', (data) => {
         if (data.updated_type === 'player_status_updated') {
             UpdatesPlayer(data);
-        } else if (data.updated_type === 'music_library_updated') {
+        } else if (data.updated_type === 'music_list_updated') {
+            musicLibraryItems = data.music_list || [];
             refreshMusicList(data);
+        } else if (data.updated_type === 'music_items_updated') {
+            mergeMusicItems(data.items || []);
         } else if (data.updated_type === 'download_status_updated') {
             updateDownloadStatusUI(data);
         }
@@ -125,23 +133,108 @@ function StatusUpdates(socket) {
     socket.emit('update_status');
 }
 
+// 播放器状态使用短键名推送，与 app.py 中的 PLAYER_SHORT_KEYS 对应
+const PLAYER_KEYS = {
+    s: 'status',
+    l: 'playlist_name',
+    m: 'current_music',
+    t: 'current_time',
+    d: 'total_time',
+    o: 'playback_mode',
+    ot: 'playback_mode_text',
+    v: 'current_volume'
+};
+
+function expandPlayerData(compact) {
+    const player = {};
+    Object.entries(PLAYER_KEYS).forEach(([short, key]) => { player[key] = compact[short]; });
+    return player;
+}
+
 function UpdatesPlayer(data) {
     const playerInfoDiv = document.getElementById('player-info');
     if (!playerInfoDiv) return;
     playerInfoDiv.innerHTML = '<p><i class="fas fa-spinner fa-spin"></i> 连接到播放器状态服务...</p>';
     
     try {
-        playerInfoDiv.innerHTML = data.error ? `<p style="color: var(--error-color);"><i class="fas fa-exclamation-circle"></i> 获取播放器状态失败: ${data.error}</p>` : (data.message || '<p>未能获取播放器状态。</p>');
+        if (data.error) {
+            playerInfoDiv.innerHTML = `<p style="color: var(--error-color);"><i class="fas fa-exclamation-circle"></i> 获取播放器状态失败: ${data.error}</p>`;
+            return;
+        }
+        if (!data.data) {
+            playerInfoDiv.innerHTML = data.message || '<p>未能获取播放器状态。</p>';
+            return;
+        }
+        const player = expandPlayerData(data.data);
+        const lines = [`<p><i class="fas fa-headphones"></i> 状态: ${player.status}</p>`];
+        if (player.current_music) {
+            const prefix = player.playlist_name ? `${escapeJSString(player.playlist_name)}/` : '';
+            lines.push(`<p><i class="fas fa-music"></i> 正在播放: ${prefix}${escapeJSString(player.current_music)}</p>`);
+            lines.push(`<p><i class="fas fa-clock"></i> 进度: ${player.current_time} / ${player.total_time}</p>`);
+        }
+        lines.push(`<p><i class="fas fa-redo"></i> 模式: ${player.playback_mode_text}</p>`);
+        lines.push(`<p><i class="fas fa-volume-up"></i> 音量: ${player.current_volume}</p>`);
+        playerInfoDiv.innerHTML = lines.join('');
     } catch (e) {
         playerInfoDiv.innerHTML = `<p style="color: var(--error-color);"><i class="fas fa-exclamation-triangle"></i> 解析播放器状态时出错。</p>`;
     }
 }
 
+function previewTrack(name) {
+    // 浏览器通过 Range 请求按需加载和拖动进度，不需要下载整首歌
+    const previewPlayer = document.getElementById('preview-player');
+    if (!previewPlayer) return;
+    previewPlayer.src = '/api/preview/' + name.split('/').map(encodeURIComponent).join('/');
+    previewPlayer.style.display = 'block';
+    previewPlayer.play().catch(error => console.error('试听失败:', error));
+}
+
+async function loadDiagnostics() {
+    const diagnosticsDiv = document.getElementById('diagnostics-info');
+    if (!diagnosticsDiv) return;
+    diagnosticsDiv.innerHTML = '<p><i class="fas fa-spinner fa-spin"></i> 正在加载...</p>';
+    try {
+        const response = await fetch('/api/diagnostics');
+        const stats = await response.json();
+        const frames = stats.frames;
+        const loop = stats.loop;
+        diagnosticsDiv.innerHTML = `
+            <p><strong>帧读取 (最近 ${frames.window_seconds} 秒, ${frames.count} 帧):</strong>
+               p50 ${frames.read_p50_ms} ms / p99 ${frames.read_p99_ms} ms / 最大 ${frames.read_max_ms} ms</p>
+            <p><strong>延迟帧:</strong> ${frames.late_frames} &nbsp; <strong>读取超时:</strong> ${frames.slow_reads} &nbsp; <strong>空读:</strong> ${frames.empty_reads}</p>
+            <p><strong>启动:</strong> 首帧前读取 ${frames.startup_reads} 次 / 最长 ${frames.startup_max_ms} ms / 启动慢 ${frames.slow_starts}</p>
+            <p><strong>事件循环延迟:</strong> p50 ${loop.lag_p50_ms} ms / p99 ${loop.lag_p99_ms} ms / 最大 ${loop.lag_max_ms} ms</p>
+            <p><i class="fas fa-lightbulb"></i> ${stats.diagnosis}</p>`;
+    } catch (error) {
+        console.error('获取诊断数据失败:', error);
+        diagnosticsDiv.innerHTML = `<p style="color: var(--error-color);"><i class="fas fa-exclamation-circle"></i> 获取诊断数据失败。</p>`;
+    }
+}
+
 function escapeJSString(str) {
     if (typeof str !== 'string') return '';
     return str.replace(/\\/g, '\\\\').replace(/'/g, "\\'").replace(/"/g, '\\"');
 }
 
+// 当前显示的音乐库条目，增量更新 (music_items_updated) 时按类型和名称合并后重新渲染
+let musicLibraryItems = [];
+
+function mergeMusicItems(items) {
+    items.forEach(item => {
+        const index = musicLibraryItems.findIndex(m => m.type === item.type && m.name === item.name);
+        if (index >= 0) {
+            musicLibraryItems[index] = item;
+        } else if (item.type === 'mp3') {
+            // 单曲排在播放列表之前，与服务器端索引的顺序一致
+            const firstPlaylist = musicLibraryItems.findIndex(m => m.type === 'playlist');
+            musicLibraryItems.splice(firstPlaylist >= 0 ? firstPlaylist : musicLibraryItems.length, 0, item);
+        } else {
+            musicLibraryItems.push(item);
+        }
+    });
+    refreshMusicList({ music_list: musicLibraryItems });
+}
+
 function refreshMusicList(data) {
     const musicLibraryDiv = document.getElementById('music-library');
     if (!musicLibraryDiv) return;
@@ -167,26 +260,28 @@ function refreshMusicList(data) {
             const itemName = escapeJSString(item.name);
 
             if (item.type === 'mp3') {
-                const itemPath = escapeJSString(item.path);
+                const itemPath = itemName;
                 htmlContent += `
                     <div class="music-entry">
                         <span><i class="fas fa-music"></i> ${itemName}</span>
                         <div class="music-actions">
+                            <button class="action-button small-action" onclick="previewTrack('${itemName}')" title="在浏览器中试听"><i class="fas fa-headphones"></i> 试听</button>
                             <button class="delete-button action-button small-action danger-action" onclick="handleDeleteSubmit('${itemPath}', '${itemName}')" title="删除此歌曲"><i class="fas fa-trash-alt"></i> 删除</button>
                         </div>
                     </div>`;
-            } else if (item.type === 'playlist' && Array.isArray(item.path)) {
+            } else if (item.type === 'playlist' && Array.isArray(item.music)) {
                 playlistsForDropdown.push({ name: item.name }); 
                 const playlistNameForJS = escapeJSString(item.name); 
 
-                const playlistSongsHTML = item.path.length > 0
-                    ? item.path.map(song => {
-                        const songName = escapeJSString(song.name);
-                        const songPath = escapeJSString(song.path);
+                const playlistSongsHTML = item.music.length > 0
+                    ? item.music.map(song => {
+                        const songName = escapeJSString(song);
+                        const songPath = `${playlistNameForJS}/${songName}`;
                         return `
                             <div class="music-entry">
                                 <span><i class="fas fa-file-audio"></i> ${songName}</span>
                                 <div class="music-actions">
+                                    <button class="action-button small-action" onclick="previewTrack('${playlistNameForJS}/${songName}')" title="在浏览器中试听"><i class="fas fa-headphones"></i> 试听</button>
                                     <button class="delete-button action-button small-action danger-action" onclick="handleDeleteSubmit('${songPath}', '${songName}')" title="从此播放列表移除"><i class="fas fa-times-circle"></i> 移除</button>
                                 </div>
                             </div>`;
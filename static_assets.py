@@ -0,0 +1,100 @@
+# static_assets.py
+
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 静态资源在启动时读入内存并预压缩 (gzip / brotli)，URL 带内容哈希，可设置为 immutable 长期缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# 小于该大小的内容压缩收益不大
+MIN_COMPRESS_SIZE = 512
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """生成各编码版本，只保留比原文更小的压缩结果"""
+    variants = {"identity": body}
+    if len(body) < MIN_COMPRESS_SIZE:
+        return variants
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gz) < len(body):
+        variants["gzip"] = gz
+    if brotli:
+        br = brotli.compress(body, quality=11)
+        if len(br) < len(body):
+            variants["br"] = br
+    return variants
+
+
+def choose_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> str:
+    """按 Accept-Encoding 选择编码：br 优先，其次 gzip"""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    for encoding in ("br", "gzip"):
+        if encoding in variants and encoding in accepted:
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """检查条件请求的 If-None-Match 是否命中 (忽略弱校验前缀)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+class Asset:
+    """一个预压缩的静态资源"""
+    __slots__ = ("mimetype", "digest", "etag", "variants")
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.etag = f'"{self.digest}"'
+        self.variants = compress_variants(body)
+
+
+class StaticAssets:
+    """静态资源表：启动时加载 static/ 目录"""
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.assets: Dict[str, Asset] = {}
+
+    def load(self) -> int:
+        """读取并预压缩所有静态文件，返回文件数量"""
+        assets = {}
+        for path in self.folder.rglob("*"):
+            if not path.is_file():
+                continue
+            name = path.relative_to(self.folder).as_posix()
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if mimetype.startswith("text/") or mimetype in ("application/javascript", "image/svg+xml"):
+                mimetype += "; charset=utf-8"
+            assets[name] = Asset(path.read_bytes(), mimetype)
+        self.assets = assets
+        print(f"DEBUG: 已预压缩 {len(assets)} 个静态文件 (brotli: {'开启' if brotli else '未安装'})。")
+        return len(assets)
+
+    def get(self, name: str) -> Optional[Asset]:
+        return self.assets.get(name)
+
+    def version(self, name: str) -> Optional[str]:
+        """返回资源的内容哈希，用于构造带版本的 URL"""
+        asset = self.assets.get(name)
+        return asset.digest if asset else None
+
+
+def select_variant(variants: Dict[str, bytes], accept_encoding: str) -> Tuple[bytes, str]:
+    """返回 (正文, 编码)"""
+    encoding = choose_encoding(accept_encoding, variants)
+    return variants[encoding], encoding
@@ -1,47 +1,117 @@
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Union, Any, Callable, Hashable, Tuple
 from pathlib import Path
 import os
 import subprocess
 import re
 import time
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from events import publish
+from library import LibrarySnapshot, LibraryItem, SongColumns, build_items, compact
+from metrics import library_items, library_rescan_duration
 # --- 修复 1: 导入 bot 以便在 get_player 中检查 VoiceClient ---
 from dc_config import messages, music_player, bot
-from dotenv import load_dotenv
 
-# 加载环境变量
-load_dotenv()
 
 # --- 全局变量和缓存 ---
-downloaded = []
 # 从 .env 读取 MUSIC_DIR
 music_dir = os.getenv("MUSIC_DIR", "mp3")
 
+# 支持的音频格式
+MUSIC_EXTENSIONS = ('.mp3', '.m4a', '.flac', '.ogg', '.wav')
+
+
 # --- 索引缓存（实现启动时索引和手动刷新）---
-_music_cache: List[Dict[str, Union[str, list]]] = []
-_last_scan_time: float = 0
+_library = LibrarySnapshot(0, (), SongColumns(), 0)
+# 串行化快照的替换 (全量扫描与增量插入)
+_library_lock = threading.Lock()
+# 全量扫描合并：扫描开始前已发出的请求都共享这次扫描的结果
+_scan_lock = threading.Lock()
+_scan_state_lock = threading.Lock()
+_scan_requested: int = 0  # 已发出的扫描请求序号
+_scan_completed: int = 0  # 最近一次完成的扫描覆盖到的请求序号
+# 歌曲元数据缓存 (时长、标签、响度)，按路径字符串索引
+_music_metadata: Dict[str, Dict[str, Union[str, float]]] = {}
+
+# --- 下载进度存储：按任务 ID 索引，原地更新 ---
+PROGRESS_TTL = 300  # 进度记录保留时间 (秒)
+PROGRESS_MIN_INTERVAL = 0.5  # 同一任务同一状态的最小更新间隔 (秒)
+_download_progress: Dict[str, Dict[str, Union[str, float]]] = {}
+_progress_lock = threading.Lock()
+_last_evict_time: float = 0
+
+# --- 阻塞操作 (文件系统扫描、ffprobe、数据库) 专用的有界线程池，避免占用事件循环 ---
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS") or 4)
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+# 事件循环中正在进行的相同操作：key -> Future
+_in_flight: Dict[Hashable, asyncio.Future] = {}
 
 
 # --------------------
 
 
+async def run_blocking(func: Callable, *args) -> Any:
+    """在有界线程池中执行阻塞函数并等待结果 (复制当前上下文，其中启动的子进程仍记在发起的命令名下)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, context.run, partial(func, *args))
+
+
+async def single_flight(key: Hashable, func: Callable, *args) -> Any:
+    """
+    相同 key 的并发调用共享同一次执行 (例如多人同时 /refresh 只扫描一次)。
+    只能在事件循环中调用；某个调用者被取消不会影响其他等待者。
+    """
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(run_blocking(func, *args))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future)
+
+
+def _evict_progress(now: float):
+    """清除超时的进度记录 (每 10 秒最多扫描一次)"""
+    global _last_evict_time
+    if now - _last_evict_time < 10:
+        return
+    _last_evict_time = now
+    expired = [task for task, item in _download_progress.items() if now - item["timestamp"] >= PROGRESS_TTL]
+    for task in expired:
+        _download_progress.pop(task, None)
+
+
 def download_status(status: Optional[Dict[str, Union[str, float]]] = None, query_id: Optional[str] = None) -> Optional[
     Dict[str, Union[str, float]]]:
-    """记录或按 ID 查询下载进度，自动清除超时项"""
+    """记录或按 ID 查询下载进度，自动清除超时项，并推送 download_progress 事件"""
     now = time.time()
 
-    global downloaded
-    downloaded = [
-        item for item in downloaded
-        if isinstance(item.get("timestamp"), (int, float)) and now - item["timestamp"] < 300
-    ]
-
-    if status:
-        status["timestamp"] = now
-        downloaded.append(status)
-    elif query_id:
-        for i, item in enumerate(downloaded):
-            if item.get("id") == query_id:
-                return downloaded.pop(i)
+    with _progress_lock:
+        _evict_progress(now)
+
+        if query_id:
+            item = _download_progress.get(query_id)
+            return dict(item) if item else None
+
+        if not status:
+            return None
+
+        task = status.get("id")
+        item = _download_progress.get(task)
+        if item and item.get("status") == status.get("status") and now - item["timestamp"] < PROGRESS_MIN_INTERVAL:
+            # 限频：丢弃过于频繁的同状态进度回调
+            return None
+
+        if item is None:
+            item = _download_progress[task] = {}
+        item.update(status)
+        item["timestamp"] = now
+        snapshot = dict(item)
+
+    publish("download_progress", snapshot)
     return None
 
 
@@ -83,8 +153,25 @@ def time_to_seconds(time_str: str) -> float:
         return 0.0
 
 
+def format_duration(duration_sec: float) -> tuple[float, str, str]:
+    """把秒数格式化为（秒、mm:ss 格式、h:mm:ss 格式）"""
+    duration_int = int(duration_sec)
+    h = duration_int // 3600
+    m = (duration_int % 3600) // 60
+    s = duration_int % 60
+
+    mm_ss = f"{m:d}:{s:02d}"
+    h_mm_ss = f"{h:d}:{m:02d}:{s:02d}" if h > 0 else mm_ss
+
+    return duration_sec, mm_ss, h_mm_ss
+
+
 def get_music_duration(file_path: Path) -> tuple[float, str, str]:
-    """获取音乐时长（秒、mm:ss 格式、h:mm:ss 格式）"""
+    """获取音乐时长（秒、mm:ss 格式、h:mm:ss 格式），优先使用元数据缓存"""
+    cached = _music_metadata.get(str(file_path))
+    if cached and cached.get("duration"):
+        return format_duration(cached["duration"])
+
     try:
         # 使用 ffprobe 获取时长
         command = [
@@ -98,23 +185,32 @@ def get_music_duration(file_path: Path) -> tuple[float, str, str]:
         creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
         result = subprocess.run(command, capture_output=True, text=True, check=True, creationflags=creationflags)
         duration_sec = float(result.stdout.strip())
+        _music_metadata.setdefault(str(file_path), {})["duration"] = duration_sec
 
-        # 格式化
-        duration_int = int(duration_sec)
-        h = duration_int // 3600
-        m = (duration_int % 3600) // 60
-        s = duration_int % 60
-
-        mm_ss = f"{m:d}:{s:02d}"
-        h_mm_ss = f"{h:d}:{m:02d}:{s:02d}" if h > 0 else mm_ss
-
-        return duration_sec, mm_ss, h_mm_ss
+        return format_duration(duration_sec)
 
     except Exception:
         # 错误时返回默认值
         return 0.0, "0:00", "0:00"
 
 
+def cached_duration(file_path: Path) -> Optional[float]:
+    """元数据缓存中的时长 (秒)，不调用 ffprobe；未知时返回 None"""
+    cached = _music_metadata.get(str(file_path))
+    return cached.get("duration") if cached and cached.get("duration") else None
+
+
+async def warm_duration(file_path: Path):
+    """
+    在线程池中读取时长并写入缓存 (同一文件并发只执行一次 ffprobe)，读取后重新推送播放器状态。
+    get_player 只读取缓存，切歌时由 play_track 调用，避免在事件循环中运行 ffprobe。
+    """
+    if cached_duration(file_path) is not None:
+        return
+    await single_flight(("duration", str(file_path)), get_music_duration, file_path)
+    publish("player_changed")
+
+
 def get_name(path: Path) -> str:
     """
     【已优化】从路径获取歌曲或列表名称。
@@ -139,112 +235,217 @@ def get_name(path: Path) -> str:
 
 
 # --- 优化后的 get_music 函数 (支持嵌套文件夹作为播放列表，且返回 paths) ---
-def get_music(check: Optional[str] = None) -> Optional[List[Dict[str, Union[str, list]]]]:
+def get_music(check: Optional[str] = None) -> Optional[Tuple[LibraryItem, ...]]:
     """
     【已优化】返回播放列表和音乐 (支持嵌套文件夹作为播放列表)。
     如果 check="force_rescan"，则强制重新扫描文件系统。
+    同时发生的扫描请求会合并：等待中的请求共享下一次扫描的结果，而不是各自再扫描一遍。
+    返回值是当前快照的条目 (tuple of LibraryItem)，只读。
     """
-    global _music_cache, _last_scan_time
+    global _scan_requested, _scan_completed
 
     # 检查是否需要强制重新扫描
-    if check != "force_rescan" and _music_cache:
+    if check != "force_rescan" and _library.items:
         # 如果不是强制刷新，且缓存不为空，则直接返回缓存
-        return _music_cache
-
-    music = []
-
-    # 清空缓存，准备重新扫描
-    _music_cache = []
-    _last_scan_time = time.time()
+        return _library.items
+
+    with _scan_state_lock:
+        _scan_requested += 1
+        ticket = _scan_requested
+
+    with _scan_lock:
+        if check != "force_rescan" and _library.items:
+            return _library.items
+        if _scan_completed >= ticket:
+            # 等待期间已有一次在本请求之后开始的扫描完成
+            return _library.items or None
+        with _scan_state_lock:
+            covered = _scan_requested
+        music = _scan_music()
+        _scan_completed = covered
+        return music
+
+
+def _scan_music() -> Optional[Tuple[LibraryItem, ...]]:
+    """扫描文件系统并发布新快照 (调用方持有 _scan_lock)"""
+    scan_started = time.perf_counter()
+    scanned_at = time.time()
 
     music_path = Path(music_dir)
     if not music_path.exists():
         print(f"WARNING: Music directory {music_dir} does not exist.")
+        _publish_library((), SongColumns(), scanned_at)
         return None
 
     # rglob 递归查找所有多媒体文件
-    all_files = (
-    list(music_path.rglob('*.mp3')) + 
-    list(music_path.rglob('*.m4a')) + 
-    list(music_path.rglob('*.flac')) +
-    list(music_path.rglob('*.ogg')) +  # <--- 新增格式
-    list(music_path.rglob('*.wav'))    # <--- 新增格式
-    )
-
-    playlists = {}
-
-    for file_path in all_files:
-        # 计算相对于 music_dir 的路径
-        try:
-            relative_path = file_path.relative_to(music_path)
-        except ValueError:
-            # 文件不在 music_dir 下，跳过
-            continue
+    all_files = [file_path for ext in MUSIC_EXTENSIONS for file_path in music_path.rglob(f'*{ext}')]
+    music, columns = build_items(music_path, all_files)
+    del all_files
 
-        # 获取文件的相对父目录路径
-        relative_dir_path = relative_path.parent
-        song_name = file_path.stem
+    # 构建完成后整体发布，扫描期间读者看到的仍是旧快照
+    snapshot = _publish_library(music, columns, scanned_at)
+    library_rescan_duration.observe(time.perf_counter() - scan_started)
 
-        # 检查是否在根目录 (relative_dir_path == Path('.'))
-        if relative_dir_path != Path('.'):
-            # 播放列表：使用相对目录路径作为播放列表名，使用 '/' 作为内部连接符
-            # 例如：FolderA/SubFolderB 将被视为一个独立的播放列表
-            playlist_name = str(relative_dir_path).replace(os.path.sep, '/')
+    # 打印日志
+    print(f"DEBUG: Music index refreshed. Found {len(music)} items (including playlists).")
+    publish("library_changed", {"action": "rescan"})
 
-            if playlist_name not in playlists:
-                playlists[playlist_name] = {
-                    "type": "playlist",
-                    "name": playlist_name,
-                    "music": [],  # 歌曲名称列表 (仅文件名)
-                    "paths": []  # 歌曲的绝对路径列表 (Path对象)
-                }
+    return snapshot.items
 
-            # 歌曲名称使用相对路径，而不是仅文件名
-            playlists[playlist_name]["music"].append(song_name)
-            playlists[playlist_name]["paths"].append(file_path)
 
-        else:
-            # 根目录歌曲 (单曲)
-            music.append({
-                "type": "mp3",
-                "name": song_name,
-                "paths": [file_path]  # 单曲的绝对路径
-            })
-
-    # 将播放列表添加到结果中
-    # FIX: 必须在最终输出中包含 'paths' 列表，供 play_command 使用
-    final_playlists = []
-    for p_name, p_data in playlists.items():
-        final_playlists.append({
-            "type": p_data["type"],
-            "name": p_data["name"],
-            "music": p_data["music"],
-            "music_count": len(p_data["music"]),
-            "paths": p_data["paths"]  # <--- 修复：将路径列表加入最终的播放列表对象
-        })
-
-    music.extend(final_playlists)
-
-    # 更新缓存
-    _music_cache = music
+def _publish_library(items: Tuple[LibraryItem, ...], columns: SongColumns, scanned_at: float) -> LibrarySnapshot:
+    """原子替换当前快照 (版本号递增)"""
+    global _library
+    with _library_lock:
+        _library = LibrarySnapshot(_library.version + 1, items, columns, scanned_at)
+        return _library
+
+
+def get_library() -> LibrarySnapshot:
+    """当前索引快照 (无锁读取；不会触发扫描)"""
+    return _library
+
+
+def _name_index(snapshot: LibrarySnapshot) -> Tuple[Dict[str, LibraryItem], Dict[str, LibraryItem]]:
+    """名称 -> 条目 (同名时保留靠前的条目，与顺序查找一致)，以及播放列表名 -> 播放列表"""
+    by_name, playlists = {}, {}
+    for item in snapshot.items:
+        by_name.setdefault(item["name"], item)
+        if item["type"] == "playlist":
+            playlists.setdefault(item["name"], item)
+    return by_name, playlists
+
+
+def find_music(name: str, library: Optional[LibrarySnapshot] = None) -> Optional[Union[LibraryItem, Dict]]:
+    """按名称在音乐库中查找单曲、播放列表或 "列表/歌曲"，与 /play 使用同一索引"""
+    if library is None:
+        library = get_library()
+    if not library.items:
+        return None
+    by_name, playlists = library.memo("name_index", _name_index)
+
+    if "/" in name:
+        # 尝试匹配播放列表中的单曲
+        playlist_name, song_name_stem = name.rsplit("/", 1)
+        item = playlists.get(playlist_name)
+        path = item.song_path(song_name_stem) if item else None
+        if path:
+            return {
+                "type": "playlist_song",
+                "name": song_name_stem,
+                "path": path,
+                "playlist_name": playlist_name
+            }
+
+    # 尝试匹配根目录单曲或播放列表
+    return by_name.get(name)
+
+
+def _count_items(snapshot: LibrarySnapshot) -> Dict[tuple, int]:
+    return {
+        ("song",): snapshot.song_count(),
+        ("playlist",): sum(1 for item in snapshot.items if item.type == "playlist"),
+    }
+
+
+def _library_counts() -> Dict[tuple, int]:
+    """抓取指标时计算索引规模 (按快照缓存)"""
+    return _library.memo("counts", _count_items)
 
-    # 打印日志
-    print(f"DEBUG: Music index refreshed. Found {len(music)} items (including playlists).")
 
-    return music
+library_items.set_function(_library_counts)
+
+
+def add_music_file(file_path: Path, metadata: Optional[Dict[str, Union[str, float]]] = None) -> Optional[LibraryItem]:
+    """
+    把新下载的文件增量插入索引 (无需全量扫描)，并发布 library_changed 事件。
+    返回受影响的条目 (单曲或播放列表)。
+    """
+    global _library
+
+    music_path = Path(music_dir)
+    try:
+        relative_path = file_path.resolve().relative_to(music_path.resolve())
+    except ValueError:
+        return None
+    if file_path.suffix.lower() not in MUSIC_EXTENSIONS:
+        return None
+
+    # 统一成与全量扫描相同的路径形式，保证队列中的 Path 比较一致
+    file_path = music_path / relative_path
+    if metadata:
+        _music_metadata[str(file_path)] = metadata
+
+    with _library_lock:
+        if not _library.scanned_at:
+            # 索引尚未建立，首次扫描会包含该文件
+            return None
+
+        music = list(_library.items)
+        columns = _library.columns
+        relative_dir_path = relative_path.parent
+        song_name = file_path.stem
+        song = (song_name, file_path.suffix)
+
+        if relative_dir_path == Path('.'):
+            item = next((m for m in music if m.type == "mp3" and m.name == song_name and file_path in m["paths"]),
+                        None)
+            if item:
+                return item
+            item = LibraryItem("mp3", song_name, music_path, columns, *columns.append((song,)))
+            # 单曲排在播放列表之前，与全量扫描的顺序一致
+            index = next((i for i, m in enumerate(music) if m.type == "playlist"), len(music))
+            music.insert(index, item)
+        else:
+            playlist_name = str(relative_dir_path).replace(os.path.sep, '/')
+            index = next((i for i, m in enumerate(music) if m.type == "playlist" and m.name == playlist_name), None)
+            if index is None:
+                item = LibraryItem("playlist", playlist_name, file_path.parent, columns, *columns.append((song,)))
+                music.append(item)
+            else:
+                old_item = music[index]
+                if file_path in old_item["paths"]:
+                    return old_item
+                if old_item.stop == len(columns.stems):
+                    # 区间已在列尾 (例如连续下载同一个播放列表)：直接追加新歌，无需复制
+                    start, stop = old_item.start, columns.append((song,))[1]
+                else:
+                    # 把原区间复制到列尾再追加新歌，持有旧快照的读者引用的区间不受影响
+                    start, stop = columns.append(list(old_item.songs()) + [song])
+                    columns.dead += len(old_item)
+                item = LibraryItem("playlist", playlist_name, old_item.folder, columns, start, stop)
+                music[index] = item
+
+        if columns.dead > len(columns.stems) - columns.dead:
+            # 旧区间多于仍在使用的歌曲时重建列，保证索引大小与歌曲数成正比
+            music, columns = compact(music)
+            item = next(m for m in music if m.type == item.type and m.name == item.name)
+
+        # 已持有 _library_lock，直接替换 (扫描时间不变)
+        _library = LibrarySnapshot(_library.version + 1, tuple(music), columns, _library.scanned_at)
+
+    print(f"DEBUG: Music index updated incrementally: {get_name(file_path)}")
+    publish("library_changed", {"action": "added", "item": item})
+    return item
 
 
 # ----------------------------------------------------
 
 
+def active_voice_client():
+    """正在播放 (或暂停) 的 VoiceClient；都空闲时返回第一个连接 (常驻频道可能同时连接多个)"""
+    voice_clients = bot.voice_clients
+    return next((vc for vc in voice_clients if vc.is_playing() or vc.is_paused()),
+                voice_clients[0] if voice_clients else None)
+
+
 def get_player() -> Dict[str, Union[str, int]]:
     """获取播放器状态"""
     vc = None
 
     # --- 修复 1: 使用全局导入的 bot 对象查找 VoiceClient ---
-    if music_player.play_queue and bot.voice_clients:
-        # 简化：获取第一个连接的 VoiceClient
-        vc = bot.voice_clients[0]
+    if music_player.play_queue:
+        vc = active_voice_client()
 
     current_time_str = "0:00"
     total_time_str = "0:00"
@@ -269,13 +470,14 @@ def get_player() -> Dict[str, Union[str, int]]:
         # --- 修复 1: 确保 vc 存在且状态可判断 ---
         if vc and vc.is_playing():
             status = "播放中"
-        elif vc and vc.is_paused():
+        elif vc and vc.is_paused() or music_player.released is not None:
             status = "暂停"
         # ------------------------------------
 
-        # 只有在播放或暂停时才计算时间
+        # 只有在播放或暂停时才计算时间 (只读取缓存，未缓存的时长由 warm_duration 在后台读取)
         if status != "空闲":
-            _, total_time_str, _ = get_music_duration(current_path)
+            duration = cached_duration(current_path)
+            total_time_str = format_duration(duration)[1] if duration else "0:00"
             # 注意：实际播放进度在 discord.py 中难以准确获取，这里保持简化
             current_time_str = "0:00"
 
@@ -362,3 +564,5 @@ def edit_play_queue(music: Optional[Path] = None, music_name: Optional[str] = No
             music_player.current_track_index = max(0, len(music_player.play_queue) - 1)
     else:
         music_player.current_track_index = 0
+
+    publish("player_changed")